@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+from ortools.sat.python import cp_model
+import math
+import numpy
+import time
+
+from errors import log_message
+from desk_model import apply_solver_settings, solution_array, violated_rules, total
+
+
+"""
+Alternative schedules: after the best schedule, up to k - 1 other schedules
+whose objective is at most max_loss below the best one, and which differ from
+every schedule found before in at least min_distance assignments (Hamming
+distance over the shift variables: moving one shift from a librarian to
+another counts 2). Each one is a new solve of the same model with these
+constraints added, hinted with the previous schedule, within a share of the
+total time budget.
+"""
+
+# Number of schedules when the searchForAllSolutions rule is selected without --alternatives
+default_alternatives = 3
+
+# Defaults of the command line options
+default_min_distance = 10
+default_time_budget = 60.0
+
+# Default objective loss accepted for an alternative, share of the best objective
+default_loss_ratio = 0.02
+
+
+def hamming_distance(desk, previous):
+    """
+    Number of shift variables whose value differs from the previous assignment
+    """
+    kept = previous.astype(numpy.int64)
+    return total(desk['shifts'], 1 - 2 * kept) + int(kept.sum())
+
+
+def find_alternatives(desk, solver_settings, best, best_objective, count, log_output, min_distance=None,
+                      max_loss=None, time_budget=None):
+    """
+    Up to count - 1 alternatives to the best assignment, as dicts with the assignment, objective,
+    soft rules violated, solver status and distance to each of the previous schedules
+    """
+    if min_distance is None:
+        min_distance = default_min_distance
+    if max_loss is None:
+        max_loss = math.ceil(abs(best_objective) * default_loss_ratio)
+    if time_budget is None:
+        time_budget = default_time_budget
+    model = desk['model']
+    found = [best]
+    alternatives = []
+    deadline = time.perf_counter() + time_budget
+    model.Add(desk['objective'] >= int(math.floor(best_objective)) - max_loss)
+    log_message(log_output, f'Looking for {count - 1} alternative schedule(s): objective >= {best_objective} - {max_loss}, '
+                            f'at least {min_distance} different assignments, {time_budget}s in total')
+    for k in range(1, count):
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            log_message(log_output, f'Time budget spent after {len(alternatives)} alternative(s)')
+            break
+        model.Add(hamming_distance(desk, found[-1]) >= min_distance)
+        model.ClearHints()
+        for n, d, s, lo in numpy.argwhere(desk['feasible']):
+            model.AddHint(desk['shifts'][n, d, s, lo], int(found[-1][n, d, s, lo]))
+        solver = cp_model.CpSolver()
+        apply_solver_settings(solver, solver_settings)
+        # An equal share of what is left for each alternative still to find
+        solver.parameters.max_time_in_seconds = min(solver.parameters.max_time_in_seconds, remaining / (count - k))
+        status = solver.Solve(model)
+        if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            log_message(log_output, f'No alternative {k}: {solver.StatusName(status)}')
+            break
+        assignment = solution_array(solver, desk['shifts'], desk['indices'])
+        distances = [int(numpy.count_nonzero(assignment != previous)) for previous in found]
+        alternatives.append({
+            'assignment': assignment,
+            'objective': int(round(solver.ObjectiveValue())),
+            'violated_rules': violated_rules(desk, solver),
+            'status': solver.StatusName(status),
+            'distances': distances,
+            'stats': f'{solver.ResponseStats()}',
+        })
+        log_message(log_output, f'Alternative {k}: {solver.StatusName(status)}, objective {solver.ObjectiveValue()}, '
+                                f'{distances[0]} assignment(s) different from the best schedule')
+        found.append(assignment)
+    return alternatives
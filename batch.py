@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import argparse
+import json
+import os
+import shutil
+import time
+import traceback
+from multiprocessing import Process
+from multiprocessing.connection import wait
+
+from errors import init_main_log, init_error_log, log_error_message, get_stack_trace, flush_logs
+from run_metrics import metrics_filename
+
+
+"""
+Batch runs: several workbooks (each with an optional Absences export) solved
+in parallel worker processes. Each run gets its own directory under the
+output directory, with a copy of its workbook, so that its logs, vacation.json,
+cache and reports never mix with those of another run. One process per run:
+a run that crashes, even the whole process, is reported as such and the other
+runs go on. The summary table of all the runs is printed and written to
+batch_summary.html and batch_summary.json.
+"""
+
+summary_name = 'batch_summary'
+
+# Name of the run summary written by each worker in its run directory
+run_summary_name = 'run_summary.json'
+
+
+def parse_job(spec):
+    """
+    'workbook.xlsx' or 'workbook.xlsx=absences.html', several exports or directories separated by commas
+    """
+    workbook, separator, absences = spec.partition('=')
+    return {'workbook': os.path.abspath(workbook),
+            'absences': [os.path.abspath(source) for source in absences.split(',')] if absences != '' else None}
+
+
+def run_names(jobs):
+    """
+    One directory name per job, from the workbook name, numbered if several workbooks have the same name
+    """
+    names = []
+    for job in jobs:
+        base = os.path.basename(job['workbook']).replace('.xlsx', '')
+        name = base
+        k = 2
+        while name in names:
+            name = f'{base}_{k}'
+            k += 1
+        names.append(name)
+    return names
+
+
+def run_job(job, run_directory, options):
+    """
+    Worker process: one complete run in its own directory, its summary written to run_summary.json
+    """
+    # Imported here, so that a crash while loading OR-Tools is a crash of this run only
+    from or_librarydesk_schedule import main
+    from parse_absences import parse_absences
+
+    start = time.perf_counter()
+    os.makedirs(run_directory, exist_ok=True)
+    os.chdir(run_directory)
+    parameter_file = os.path.join(run_directory, os.path.basename(job['workbook']))
+    log_output = parameter_file.replace('.xlsx', '') + '_log.txt'
+    error_output = parameter_file.replace('.xlsx', '') + '_errors.txt'
+    vacation_file = os.path.join(run_directory, 'vacation.json')
+    summary = {'workbook': job['workbook'], 'absences': job['absences'], 'directory': run_directory,
+               'log': log_output, 'errors': error_output}
+    try:
+        shutil.copyfile(job['workbook'], parameter_file)
+        init_main_log(log_output)
+        init_error_log(error_output)
+        if job['absences'] is not None:
+            parse_absences(job['absences'], log_output, error_output, vacation_file)
+        summary.update(main(parameter_file, log_output, error_output, vacation_file=vacation_file, **options))
+    except Exception as e:
+        # INFEASIBLE, time limit...: main saved the status in the metrics before giving up
+        summary['status'] = 'ERROR'
+        if os.path.exists(metrics_filename(parameter_file)):
+            with open(metrics_filename(parameter_file), 'r') as fp:
+                summary['status'] = json.load(fp).get('status') or 'ERROR'
+        summary['error'] = f'{e}'
+        try:
+            log_error_message(error_output, get_stack_trace(e))
+        except OSError:
+            summary['error'] += '\n' + traceback.format_exc()
+    summary.setdefault('total_seconds', round(time.perf_counter() - start, 4))
+    flush_logs()
+    with open(os.path.join(run_directory, run_summary_name), 'w') as fp:
+        json.dump(summary, fp, indent=1, default=str)
+
+
+def run_batch(jobs, output_directory, workers=1, options=None):
+    """
+    Run the jobs, at most workers at a time; returns one summary per job, in order
+    """
+    if options is None:
+        options = {}
+    names = run_names(jobs)
+    directories = [os.path.abspath(os.path.join(output_directory, name)) for name in names]
+    pending = list(range(len(jobs)))
+    running = {}
+    summaries = [None] * len(jobs)
+    while len(pending) > 0 or len(running) > 0:
+        while len(pending) > 0 and len(running) < workers:
+            k = pending.pop(0)
+            # A previous summary or metrics file in the same directory would be taken for this run's
+            parameter_file = os.path.join(directories[k], os.path.basename(jobs[k]['workbook']))
+            for previous_file in (os.path.join(directories[k], run_summary_name), metrics_filename(parameter_file)):
+                if os.path.exists(previous_file):
+                    os.remove(previous_file)
+            process = Process(target=run_job, args=(jobs[k], directories[k], options))
+            process.start()
+            running[process.sentinel] = (k, process, time.perf_counter())
+            print(f'Started {names[k]}')
+        for sentinel in wait(list(running.keys())):
+            k, process, start = running.pop(sentinel)
+            process.join()
+            summary_file = os.path.join(directories[k], run_summary_name)
+            if os.path.exists(summary_file):
+                with open(summary_file, 'r') as fp:
+                    summaries[k] = json.load(fp)
+            else:
+                # The process died without writing its summary
+                summaries[k] = {'workbook': jobs[k]['workbook'], 'absences': jobs[k]['absences'],
+                                'directory': directories[k], 'status': 'CRASHED',
+                                'error': f'worker process exit code {process.exitcode}',
+                                'total_seconds': round(time.perf_counter() - start, 4)}
+            summaries[k]['name'] = names[k]
+            print(f"Finished {names[k]}: {summaries[k].get('status')}")
+    return summaries
+
+
+def objective_text(summary):
+    if summary.get('objective') is None:
+        return ''
+    return f"{summary['objective']}/{summary.get('max_score')}"
+
+
+def write_summary(output_directory, summaries):
+    with open(os.path.join(output_directory, summary_name + '.json'), 'w') as fp:
+        json.dump(summaries, fp, indent=1, default=str)
+    html_filename = os.path.join(output_directory, summary_name + '.html')
+    with open(html_filename, 'w') as out:
+        out.write('<!DOCTYPE html>\n<html>\n<head><title>Batch summary</title></head>\n<body>\n<h1>Batch summary</h1>\n')
+        out.write('<table id="batch" class="table">\n<thead><tr><th scope="col">Run</th><th scope="col">Status</th>')
+        out.write('<th scope="col">Objective</th><th scope="col">Time (s)</th><th scope="col">Report</th>')
+        out.write('<th scope="col">Errors</th></tr></thead>\n<tbody>\n')
+        for summary in summaries:
+            reports = summary.get('reports', [])
+            report = f'<a href="{os.path.relpath(reports[0], output_directory)}">{os.path.basename(reports[0])}</a>' if len(reports) > 0 else ''
+            errors = summary.get('errors')
+            errors = f'<a href="{os.path.relpath(errors, output_directory)}">{os.path.basename(errors)}</a>' if errors is not None else ''
+            out.write(f"<tr><td>{summary['name']}</td><td>{summary.get('status')}</td><td>{objective_text(summary)}</td>")
+            out.write(f"<td>{summary.get('total_seconds')}</td><td>{report}</td><td>{errors} {summary.get('error', '')}</td></tr>\n")
+        out.write('</tbody></table>\n</body></html>')
+    return html_filename
+
+
+def print_summary(summaries):
+    print(f"{'run':>24} {'status':>10} {'objective':>12} {'seconds':>9}  output")
+    for summary in summaries:
+        output = summary['reports'][0] if len(summary.get('reports', [])) > 0 else summary.get('error', '')
+        print(f"{summary['name']:>24} {summary.get('status'):>10} {objective_text(summary):>12} "
+              f"{summary.get('total_seconds'):>9}  {output}")
+
+
+if __name__ == '__main__':
+    script_description = 'Generate the desk schedules of several workbooks in parallel'
+    parser = argparse.ArgumentParser(description=script_description)
+    parser.add_argument('jobs', nargs='+', help='workbooks, each optionally followed by =<Absences HTML exports or directories, comma separated>')
+    parser.add_argument('--output', default='batch_output', help='directory of the run directories and of the summary')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='runs at the same time (default: number of cores)')
+    parser.add_argument('--max-time', type=float, help="solver time limit of each run in seconds (overrides the 'solveur' sheets)")
+    parser.add_argument('--solver-workers', type=int, help='number of parallel search workers of each run')
+    parser.add_argument('--weekly', action='store_true', help='solve long periods week by week')
+    args = parser.parse_args()
+
+    jobs = [parse_job(spec) for spec in args.jobs]
+    options = {
+        'solver_options': {'maxTime': args.max_time, 'numWorkers': args.solver_workers},
+        'weekly': args.weekly,
+    }
+    os.makedirs(args.output, exist_ok=True)
+    summaries = run_batch(jobs, args.output, args.workers, options)
+    print_summary(summaries)
+    print(f'Summary: {write_summary(args.output, summaries)}')
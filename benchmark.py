@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import argparse
+import json
+import os
+import platform
+import tempfile
+from datetime import datetime
+
+from errors import init_main_log, init_error_log, flush_logs
+from generate_instance import generate_instance, default_rules
+from or_librarydesk_schedule import main
+from run_metrics import metrics_filename
+
+
+"""
+Scaling benchmark: solve synthetic instances of growing size (see
+generate_instance.py) and append the per-phase times of each run to
+benchmark_results.jsonl. A phase taking much longer than in the previous run
+with the same parameters is reported as a regression.
+"""
+
+results_file = 'benchmark_results.jsonl'
+
+# Phases of main() summed into the read / build / solve / report columns
+phase_columns = {
+    'read': ['workbook read', 'check_minima', 'calendar and quotas', 'absence merge'],
+    'build': ['model build'],
+    'solve': ['solve', 'weekly model build and solve'],
+    'report': ['solution extraction', 'report rendering', 'output files'],
+}
+
+
+def parse_size(size):
+    """
+    '50x10' or '50x10x4': librarians x days [x locations]
+    """
+    values = [int(v) for v in size.lower().split('x')]
+    if len(values) == 2:
+        values.append(3)
+    return tuple(values)
+
+
+def run_instance(directory, num_librarians, num_days, num_locations, shift_length, density, rules, seed,
+                 solver_options):
+    base = os.path.join(directory, f'bench_{num_librarians}x{num_days}x{num_locations}')
+    parameter_file = base + '.xlsx'
+    log_output = base + '_log.txt'
+    error_output = base + '_errors.txt'
+    generate_instance(parameter_file, num_librarians, num_days, num_locations, shift_length, density, rules, seed=seed)
+    init_main_log(log_output)
+    init_error_log(error_output)
+    try:
+        main(parameter_file, log_output, error_output, solver_options=solver_options, use_cache=False)
+        error = None
+    except Exception as e:
+        error = f'{e}'
+    flush_logs()
+    metrics = {}
+    if os.path.exists(metrics_filename(parameter_file)):
+        with open(metrics_filename(parameter_file), 'r') as fp:
+            metrics = json.load(fp)
+    times = {}
+    for column, phases in phase_columns.items():
+        times[column] = round(sum([p['seconds'] for p in metrics.get('phases', []) if p['name'] in phases]), 4)
+    return {
+        'date': datetime.now().isoformat(),
+        'host': platform.node(),
+        'parameters': {
+            'librarians': num_librarians, 'days': num_days, 'locations': num_locations,
+            'shift_length': shift_length, 'density': density, 'rules': sorted(rules), 'seed': seed,
+            'solver': solver_options,
+        },
+        'status': metrics.get('status'),
+        'objective': metrics.get('objective'),
+        'error': error,
+        'model': metrics.get('model', {}),
+        'times': times,
+        'total_seconds': metrics.get('total_seconds'),
+        'process_peak_mb': max([p['process_peak_so_far_mb'] or 0 for p in metrics.get('phases', [])], default=None),
+    }
+
+
+def load_results(filename):
+    results = []
+    if os.path.exists(filename):
+        with open(filename, 'r') as fp:
+            for line in fp:
+                if line.strip() != '':
+                    results.append(json.loads(line))
+    return results
+
+
+def previous_result(results, record):
+    for result in reversed(results):
+        if result['parameters'] == record['parameters']:
+            return result
+    return None
+
+
+def regressions(previous, record, tolerance, min_seconds=0.25):
+    """
+    Phases slower than the previous run by more than tolerance (and min_seconds, to ignore noise)
+    """
+    slower = []
+    if previous is None:
+        return slower
+    for column, seconds in record['times'].items():
+        before = previous['times'].get(column, 0)
+        if seconds - before > min_seconds and seconds > before * (1 + tolerance):
+            slower.append(f'{column} {before}s -> {seconds}s')
+    if previous['status'] != record['status']:
+        slower.append(f"status {previous['status']} -> {record['status']}")
+    return slower
+
+
+if __name__ == '__main__':
+    script_description = 'Time the desk scheduler on synthetic instances of growing size'
+    parser = argparse.ArgumentParser(description=script_description)
+    parser.add_argument('--sizes', default='25x5,50x10,100x20',
+                        help='comma separated librarians x days [x locations], e.g. 25x5,50x10x4')
+    parser.add_argument('--shift-length', type=int, default=60, help='in minutes')
+    parser.add_argument('--density', type=float, default=0.7)
+    parser.add_argument('--rules', nargs='*', default=default_rules)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-time', type=float, default=60, help='solver time limit per instance, in seconds')
+    parser.add_argument('--workers', type=int, help='solver workers')
+    parser.add_argument('--results', default=results_file, help='JSON lines file the results are appended to')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='slowdown reported as a regression')
+    parser.add_argument('--keep', help='directory to keep the generated workbooks and reports in')
+
+    args = parser.parse_args()
+    solver_options = {'maxTime': args.max_time}
+    if args.workers is not None:
+        solver_options['numWorkers'] = args.workers
+    results_path = os.path.abspath(args.results)
+    results = load_results(results_path)
+
+    with tempfile.TemporaryDirectory() as temp_directory:
+        directory = os.path.abspath(args.keep) if args.keep else temp_directory
+        os.makedirs(directory, exist_ok=True)
+        # main() looks for vacation.json in the current directory
+        os.chdir(directory)
+        print(f"{'size':>12} {'status':>10} {'objective':>10} {'read':>8} {'build':>8} {'solve':>8} {'report':>8} {'variables':>10}")
+        for size in args.sizes.split(','):
+            num_librarians, num_days, num_locations = parse_size(size)
+            record = run_instance(directory, num_librarians, num_days, num_locations, args.shift_length,
+                                  args.density, args.rules, args.seed, solver_options)
+            times = record['times']
+            # An objective of 0 is a result, only a missing one is left blank
+            objective = '' if record['objective'] is None else record['objective']
+            print(f"{size:>12} {record['status'] or 'ERROR':>10} {objective:>10} {times['read']:>8} "
+                  f"{times['build']:>8} {times['solve']:>8} {times['report']:>8} {record['model'].get('variables', ''):>10}")
+            slower = regressions(previous_result(results, record), record, args.tolerance)
+            if len(slower) > 0:
+                print(f"{'':>12} regression: {', '.join(slower)}")
+            with open(results_path, 'a') as fp:
+                fp.write(json.dumps(record) + '\n')
+            results.append(record)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+from datetime import date, datetime, timedelta
+import dateparser
+import numpy
+
+from errors import log_message
+
+
+"""
+Calendar index for a planning period: each day index of the 'jours' sheet is
+resolved once to a concrete date, so that the model and the report never have
+to call dateparser again.
+"""
+
+
+def parse_day(label):
+    """
+    Convert a day label (ISO date, "lundi 08-07-2024", "Monday", or a date
+    cell read from Excel) to a datetime.date, or None if it cannot be parsed
+    """
+    if isinstance(label, datetime):
+        return label.date()
+    if isinstance(label, date):
+        return label
+    label = f'{label}'.strip()
+    try:
+        return date.fromisoformat(label)
+    except ValueError:
+        pass
+    parsed = dateparser.parse(label)
+    if parsed is None:
+        return None
+    return parsed.date()
+
+
+def build_calendar(weekdays, log_output):
+    """
+    Map each day index to {'label', 'date', 'weekday', 'week'}:
+    - weekday: 0 = Monday, as used in the 'séances' sheet
+    - week: 0 for the week of the first day, 1 for the following one, etc.
+    """
+    calendar = {}
+    reference_sunday = None
+    for d in sorted(weekdays.keys()):
+        label = weekdays[d]
+        desk_day = parse_day(label)
+        if desk_day is None:
+            raise ValueError(f'Cannot interpret day {d} ({label}) as a date')
+        # QUICKFIX make sure week days are in the current week if no specific dates are given
+        if not any(c.isdigit() for c in f'{label}'):
+            if reference_sunday is None:
+                reference_sunday = dateparser.parse('Sunday').date()
+            if desk_day < reference_sunday:
+                desk_day += timedelta(days=7)
+        calendar[d] = {'label': label, 'date': desk_day, 'weekday': desk_day.weekday()}
+
+    if len(calendar) > 0:
+        first_day = min(calendar[d]['date'] for d in calendar)
+        first_monday = first_day - timedelta(days=first_day.weekday())
+        for d in calendar:
+            calendar[d]['week'] = (calendar[d]['date'] - first_monday).days // 7
+
+    for d in calendar:
+        log_message(log_output, f"{calendar[d]['label']} is {calendar[d]['date']} (weekday {calendar[d]['weekday']}, week {calendar[d]['week']})")
+    return calendar
+
+
+def calendar_weeks(calendar):
+    """
+    Day indices grouped by calendar week, in order
+    """
+    weeks = {}
+    for d in sorted(calendar.keys()):
+        weeks.setdefault(calendar[d]['week'], []).append(d)
+    return [weeks[w] for w in sorted(weeks.keys())]
+
+
+def absence_mask(vacation, names, calendar):
+    """
+    absent[n, d] is True if names[n] is on leave on day index d.
+    vacation: {name: [(first day, last day), ...]} as in vacation.json, both days included,
+    so that a one-day leave has the same first and last day
+    """
+    dates = numpy.array([calendar[d]['date'] for d in sorted(calendar.keys())], dtype='datetime64[D]')
+    owners = []
+    firsts = []
+    lasts = []
+    for n, name in enumerate(names):
+        for leave in vacation.get(name, []):
+            first = parse_day(leave[0])
+            last = parse_day(leave[1])
+            if first is None or last is None:
+                raise ValueError(f'Cannot interpret the leave {leave} of {name} as dates')
+            owners.append(n)
+            firsts.append(first)
+            # A leave covers at least its first day, even if rounded to end the day before
+            lasts.append(max(first, last))
+    absent = numpy.zeros(shape=(len(names), len(dates)), dtype=bool)
+    if len(owners) > 0:
+        on_leave = ((dates[numpy.newaxis, :] >= numpy.array(firsts, dtype='datetime64[D]')[:, numpy.newaxis])
+                    & (dates[numpy.newaxis, :] <= numpy.array(lasts, dtype='datetime64[D]')[:, numpy.newaxis]))
+        numpy.logical_or.at(absent, numpy.array(owners), on_leave)
+    return absent
@@ -0,0 +1,645 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+from ortools.sat.python import cp_model
+import numpy
+import time
+
+from errors import log_message
+from run_metrics import record_rule_time
+
+
+"""
+Construction of the CP-SAT model for the desk schedule.
+
+The decision variables are kept in a numpy object array shifts[n, d, s, lo]
+(librarian 'n' works shift 's' on day 'd' at location lo), and the index groups
+every rule needs (locations, sectors, meeting slots, quotas...) are computed
+once, so that each rule only has to slice the array.
+"""
+
+
+# Solver settings of the 'solveur' sheet: CP-SAT parameter and value type
+solver_parameters = {
+    'maxTime': ('max_time_in_seconds', float),
+    'numWorkers': ('num_workers', int),
+    'relativeGap': ('relative_gap_limit', float),
+    'absoluteGap': ('absolute_gap_limit', float),
+    'randomSeed': ('random_seed', int),
+}
+
+
+def apply_solver_settings(solver, solver_settings):
+    for name, value in solver_settings.items():
+        setattr(solver.parameters, solver_parameters[name][0], solver_parameters[name][1](value))
+
+
+def is_reserve_location(location):
+    return location['name'].lower().find('remplacement') >= 0
+
+
+def location_open_slots(locations, num_days, num_shifts, last_shift_closed=True):
+    """
+    open_slots[d, s, lo] is True if location lo must be staffed on day d, shift s
+    """
+    num_locations = len(locations.keys())
+    open_slots = numpy.zeros(shape=(num_days, num_shifts, num_locations), dtype=bool)
+    for lo in range(num_locations):
+        for d in range(num_days):
+            times = locations[lo]['times'][d]
+            open_slots[d, times['start']:times['end'] + 1, lo] = True
+    # The last shift of the last day is never staffed
+    if last_shift_closed:
+        open_slots[num_days - 1, num_shifts - 1, :] = False
+    return open_slots
+
+
+def objective_bound(locations, num_days, num_shifts, rules, last_shift_closed=True):
+    """
+    Upper bound of the maximized objective: one request per open slot, when at most one
+    librarian per open slot is required (oneLibrarianPerShift, hard or soft); None otherwise
+    """
+    if not rules['oneLibrarianPerShift']:
+        return None
+    return int(location_open_slots(locations, num_days, num_shifts, last_shift_closed).sum())
+
+
+def index_groups(librarians, locations, quota, meeting_slots, calendar, desk_shifts, last_shift_closed=True):
+    """
+    Precompute the index groups used by the rules
+    """
+    num_librarians = len(librarians.keys())
+    num_days = len(calendar.keys())
+    num_shifts = len(desk_shifts)
+    num_locations = len(locations.keys())
+
+    groups = {}
+    groups['reserve_locations'] = [lo for lo in range(num_locations) if is_reserve_location(locations[lo])]
+    groups['active_locations'] = [lo for lo in range(num_locations) if not is_reserve_location(locations[lo])]
+    groups['sectors'] = {}
+    for n in range(num_librarians):
+        groups['sectors'].setdefault(librarians[n]['sector'], []).append(n)
+    groups['shift_minutes'] = numpy.array([x[1] for x in desk_shifts], dtype=numpy.int64)
+    # TODO: is this still valid if we switch to 2h shifts, or 2.5, or 3?
+    groups['shift_hours'] = numpy.array([int(x[1] / 60) for x in desk_shifts], dtype=numpy.int64)
+    groups['open_slots'] = location_open_slots(locations, num_days, num_shifts, last_shift_closed)
+
+    # Per-librarian quotas (worked, reserve, max days)
+    groups['quota_active'] = numpy.array([quota[librarians[n]['type']][0] for n in range(num_librarians)], dtype=numpy.int64)
+    groups['quota_reserve'] = numpy.array([quota[librarians[n]['type']][1] for n in range(num_librarians)], dtype=numpy.int64)
+    groups['quota_days'] = numpy.array([quota[librarians[n]['type']][2] for n in range(num_librarians)], dtype=numpy.int64)
+
+    # meetings[n, d, s] is True during a mandatory meeting of librarian n
+    meetings = numpy.zeros(shape=(num_librarians, num_days, num_shifts), dtype=bool)
+    for n in range(num_librarians):
+        sector_meeting = meeting_slots[librarians[n]['sector']]
+        dir_meeting = meeting_slots['dir']
+        for d in range(num_days):
+            if calendar[d]['weekday'] == sector_meeting[0]:
+                meetings[n, d, sector_meeting[1]:sector_meeting[2] + 1] = True
+            if calendar[d]['weekday'] == dir_meeting[0] and librarians[n]['type'] == 'dir':
+                meetings[n, d, dir_meeting[1]:dir_meeting[2] + 1] = True
+    groups['meetings'] = meetings
+    return groups
+
+
+def minimum_targets(groups, scale):
+    """
+    Hours each librarian must at least work over the period: minActiveShifts (half of the
+    active quota), minReserveShifts (reserve quota - 1), holidaySpecialQuota (days quota before
+    ScaleQuotas, as hours)
+    """
+    return {
+        'min_active': groups['quota_active'] - groups['quota_active'] // 2,
+        'min_reserve': groups['quota_reserve'] - 1,
+        'min_holiday': groups['quota_days'] // scale,
+    }
+
+
+def feasible_cells(requests, rules, groups, rule_weights=None):
+    """
+    feasible[n, d, s, lo] is False where an assignment can never be true:
+    - closed location hours when oneLibrarianPerShift is selected, even as a soft rule
+      (only the coverage of the open slots is soft)
+    - outside of the requested work hours (absences included) and during
+      mandatory meetings when noOutOfTimeShift is selected
+    Soft rules may be violated, their cells are kept.
+    """
+    if rule_weights is None:
+        rule_weights = {}
+    feasible = numpy.ones(shape=requests.shape, dtype=bool)
+    if rules['oneLibrarianPerShift']:
+        feasible &= groups['open_slots'][numpy.newaxis, :, :, :]
+    if rules['noOutOfTimeShift'] and 'noOutOfTimeShift' not in rule_weights:
+        feasible &= out_of_time_weights(requests, groups) == 0
+    return feasible
+
+
+def new_shift_variables(model, feasible):
+    """
+    Shift variables for the feasible cells only, the other cells hold the constant 0
+    """
+    shifts = numpy.zeros(shape=feasible.shape, dtype=object)
+    for n, d, s, lo in numpy.argwhere(feasible):
+        shifts[n, d, s, lo] = model.NewBoolVar('shift_n%id%is%ilo%i' % (n, d, s, lo))
+    return shifts
+
+
+def total(variables, coefficients=None):
+    """
+    Linear sum of an array of variables, optionally weighted.
+    Constant cells (pruned variables) are skipped.
+    """
+    variables = numpy.asarray(variables, dtype=object).ravel()
+    if coefficients is None:
+        return cp_model.LinearExpr.Sum([v for v in variables if not isinstance(v, int)])
+    coefficients = numpy.asarray(coefficients).ravel()
+    selected = [k for k in numpy.flatnonzero(coefficients) if not isinstance(variables[k], int)]
+    return cp_model.LinearExpr.WeightedSum(variables[selected].tolist(), coefficients[selected].tolist())
+
+
+def is_empty(variables):
+    return all(isinstance(v, int) for v in numpy.asarray(variables, dtype=object).ravel())
+
+
+def is_soft(desk, rule):
+    return rule in desk['rule_weights']
+
+
+def scope_name(rule, scope):
+    return rule + ''.join([f'_{key}{value}' for key, value in scope.items()])
+
+
+def add_violation(desk, variable, rule, scope):
+    """
+    Register a soft rule violation count: each unit costs the weight of the rule
+    """
+    desk['soft_rules'][variable.Index()] = (rule, scope, desk['rule_weights'][rule])
+    desk['penalties'].append((variable, desk['rule_weights'][rule]))
+
+
+def new_assumption(desk, rule, **scope):
+    """
+    Literal enforcing a rule for a scope (librarian=n, day=d, shift=s, location=lo), registered
+    as an assumption so that an infeasible model can be explained rule by rule.
+    The literal of a soft rule is free instead, at the cost of the rule's weight when false.
+    """
+    if is_soft(desk, rule):
+        violated = desk['model'].NewBoolVar(scope_name(rule, scope) + '_violated')
+        add_violation(desk, violated, rule, scope)
+        return violated.Not()
+    literal = desk['model'].NewBoolVar(scope_name(rule, scope))
+    desk['model'].AddAssumption(literal)
+    desk['assumptions'][literal.Index()] = (rule, scope)
+    return literal
+
+
+def day_assumptions(desk, rule, n, num_days):
+    """
+    Literal of a rule for librarian n on each day: the same assumption for every day when the
+    rule is hard, one literal per day when it is soft, so that each day given up costs the weight
+    """
+    if is_soft(desk, rule):
+        return [new_assumption(desk, rule, librarian=n, day=d) for d in range(num_days)]
+    return [new_assumption(desk, rule, librarian=n)] * num_days
+
+
+def add_bound(desk, rule, expression, bound, at_most=True, **scope):
+    """
+    expression <= bound (at_most) or >= bound for a scope of a rule. A soft bound may be
+    exceeded, at the cost of the rule's weight for each unit of excess.
+    """
+    model = desk['model']
+    if not is_soft(desk, rule):
+        enforce = new_assumption(desk, rule, **scope)
+        if at_most:
+            model.Add(expression <= bound).OnlyEnforceIf(enforce)
+        else:
+            model.Add(expression >= bound).OnlyEnforceIf(enforce)
+        return
+    # Every expression bounded by a rule is at most a number of hours (or weights <= 2) of one librarian
+    limit = desk['shifts'][0].size * max(2, int(numpy.ceil(desk['groups']['shift_hours'].max()))) + abs(int(bound))
+    excess = model.NewIntVar(0, limit, scope_name(rule, scope) + '_excess')
+    if at_most:
+        model.Add(expression - excess <= bound)
+    else:
+        model.Add(expression + excess >= bound)
+    add_violation(desk, excess, rule, scope)
+
+
+def add_one_librarian_per_shift(desk):
+    # Each shift at each location is assigned to exactly 1 librarian
+    # As a soft rule, at most 1 librarian is still required, and each open slot left empty costs the weight
+    model = desk['model']
+    shifts = desk['shifts']
+    open_slots = desk['groups']['open_slots']
+    n_conditions = 0
+    if is_soft(desk, 'oneLibrarianPerShift'):
+        for d, s, lo in numpy.argwhere(open_slots):
+            model.Add(total(shifts[:, d, s, lo]) <= 1)
+            covered = new_assumption(desk, 'oneLibrarianPerShift', day=int(d), shift=int(s), location=int(lo))
+            model.Add(total(shifts[:, d, s, lo]) >= 1).OnlyEnforceIf(covered)
+            n_conditions += 1
+        return n_conditions
+    for d, s in numpy.ndindex(open_slots.shape[:2]):
+        enforce = new_assumption(desk, 'oneLibrarianPerShift', day=d, shift=s)
+        for lo in range(open_slots.shape[2]):
+            model.Add(total(shifts[:, d, s, lo]) == int(open_slots[d, s, lo])).OnlyEnforceIf(enforce)
+            n_conditions += 1
+    return n_conditions
+
+
+def add_one_shift_at_a_time(desk):
+    # Each librarian is using at most 1 seat at a time!
+    model = desk['model']
+    shifts = desk['shifts']
+    n_conditions = 0
+    for n in range(shifts.shape[0]):
+        enforce = day_assumptions(desk, 'oneShiftAtATime', n, shifts.shape[1])
+        for d, s in numpy.ndindex(shifts.shape[1:3]):
+            model.Add(total(shifts[n, d, s, :]) <= 1).OnlyEnforceIf(enforce[d])
+            n_conditions += 1
+    return n_conditions
+
+
+def add_max_shifts_per_day(desk, name, max_shifts_per_day):
+    # Each librarian works at most max_shifts_per_day shifts per day.
+    model = desk['model']
+    shifts = desk['shifts']
+    n_conditions = 0
+    for n in range(shifts.shape[0]):
+        enforce = day_assumptions(desk, name, n, shifts.shape[1])
+        for d in range(shifts.shape[1]):
+            model.Add(total(shifts[n, d]) <= max_shifts_per_day).OnlyEnforceIf(enforce[d])
+            n_conditions += 1
+    return n_conditions
+
+
+def add_max_two_shifts_per_day(desk):
+    # TODO: mix Accueil and STM shifts over the week?
+    # TESTING Should still work with non-1h shifts, but probably not applicable in that case
+    return add_max_shifts_per_day(desk, 'maxTwoShiftsPerDay', 2)
+
+
+def add_max_one_shift_per_day(desk):
+    return add_max_shifts_per_day(desk, 'maxOneShiftPerDay', 1)
+
+
+def add_min_one_shift_average(desk):
+    # Each librarian works at at least min_average_shifts=1 shifts per week/over the period.
+    shifts = desk['shifts']
+    librarians = desk['librarians']
+    min_average_shifts = shifts.shape[1] // 5
+    n_conditions = 0
+    for n in range(shifts.shape[0]):
+        if desk['groups']['quota_active'][n] > 0:
+            add_bound(desk, 'minOneShiftAverage', total(shifts[n]), min_average_shifts, at_most=False, librarian=n)
+            n_conditions += 1
+        else:
+            log_message(desk['log_output'], f'{librarians[n]["name"]} is exempted from minimum av. shifts')
+    return n_conditions
+
+
+def add_prefered_run_length(desk):
+    # FIXME: 2 SUCCESSIVE shifts if requested
+    # NOTE: current version seems to favor same-day shifts but not successive?
+    # TODO: Perhaps not valid if we switch to 2h shifts, or 2.5, or 3?
+    model = desk['model']
+    shifts = desk['shifts']
+    requests = desk['requests']
+    librarians = desk['librarians']
+    num_librarians, num_days, num_shifts = shifts.shape[:3]
+    n_conditions = 0
+    for n in range(num_librarians):
+        prefered_length = librarians[n]['prefered_length']
+        if prefered_length > 1:
+            enforce = day_assumptions(desk, 'preferedRunLength', n, num_days)
+            for d in range(num_days):
+                # The number of changes from "busy" to "free" or back describes
+                # the number of discontinuous shifts
+                changes = []
+                for s in range(num_shifts - 1):
+                    delta1 = model.NewIntVar(-1, 1, 'tmp1deltan%id%is%i' % (n, d, s))
+                    delta2 = model.NewIntVar(0, 1, 'tmp2deltan%id%is%i' % (n, d, s))
+                    model.Add(total(shifts[n, d, s + 1]) - total(shifts[n, d, s]) == delta1)
+                    model.AddAbsEquality(delta2, delta1)
+                    changes.append(delta2)
+                model.Add(total(changes) * prefered_length <= 2 * total(shifts[n, d], requests[n, d])).OnlyEnforceIf(enforce[d])
+                n_conditions += 1
+    return n_conditions
+
+
+def add_max_one_late_shift(desk):
+    # only assign max. one 18-20 shift for a given librarian
+    # TESTING: should valid if we switch to 2h shifts, or 2.5, or 3?
+    shifts = desk['shifts']
+    n_conditions = 0
+    for n in range(shifts.shape[0]):
+        add_bound(desk, 'maxOneLateShift', total(shifts[n, :, -1, :]), 1, librarian=n)
+        n_conditions += 1
+    return n_conditions
+
+
+def add_no_seventeen_to_twenty(desk):
+    # prevent 17-18 + 18-20 sequence for any librarian
+    # TESTING should still be working using non-1h shifts
+    model = desk['model']
+    shifts = desk['shifts']
+    n_conditions = 0
+    for n in range(shifts.shape[0]):
+        enforce = day_assumptions(desk, 'noSeventeenToTwenty', n, shifts.shape[1])
+        for d in range(shifts.shape[1]):
+            model.Add(total(shifts[n, d, -2:, :]) <= 1).OnlyEnforceIf(enforce[d])
+            n_conditions += 1
+    return n_conditions
+
+
+def add_no_twelve_to_fourteen(desk):
+    # TESTING: should work with non-1h slots, just inoperative for 2h slots
+    # prevent 12-13 + 13-14 sequence for any librarian
+    model = desk['model']
+    shifts = desk['shifts']
+    shift_starts = [x[0] for x in desk['desk_shifts']]
+    critical_zone_minutes = [max([x for x in shift_starts if x <= 12*60]),
+                             min([x for x in shift_starts if x >= 14*60])]
+    critical_zone_slots = [shift_starts.index(c) for c in critical_zone_minutes]
+    n_conditions = 0
+    for n in range(shifts.shape[0]):
+        enforce = day_assumptions(desk, 'noTwelveToFourteen', n, shifts.shape[1])
+        for d in range(shifts.shape[1]):
+            model.Add(total(shifts[n, d, critical_zone_slots, :]) <= 1).OnlyEnforceIf(enforce[d])
+            n_conditions += 1
+    return n_conditions
+
+
+def add_max_days_at_desk(desk):
+    model = desk['model']
+    shifts = desk['shifts']
+    num_librarians, num_days = shifts.shape[:2]
+    n_conditions = 0
+    for n in range(num_librarians):
+        day_at_desk = []
+        for d in range(num_days):
+            if is_empty(shifts[n, d]):
+                continue
+            day_at_desk.append(model.NewIntVar(0, 1, 'dayatdesk_n%id%i' % (n, d)))
+            model.AddMaxEquality(day_at_desk[-1], [v for v in shifts[n, d].ravel() if not isinstance(v, int)])
+        add_bound(desk, 'maxDaysAtDesk', total(day_at_desk), int(desk['groups']['quota_days'][n]), librarian=n)
+        n_conditions += 1
+    return n_conditions
+
+
+def out_of_time_weights(requests, groups):
+    """
+    weights[n, d, s, lo] > 0 where an assignment is outside of the requested work hours
+    Shifts during mandatory meetings also count as out of time
+    """
+    meetings = groups['meetings']
+    return (1 - requests.astype(numpy.int64)) + meetings[:, :, :, numpy.newaxis]
+
+
+def hours_at(desk, n, location_group):
+    """
+    Hours worked by librarian n at the locations of the given group
+    """
+    shifts = desk['shifts']
+    selection = shifts[n][:, :, location_group]
+    hours = numpy.broadcast_to(desk['groups']['shift_hours'][:, numpy.newaxis], selection.shape)
+    return total(selection, hours)
+
+
+def add_librarian_rules(desk):
+    """
+    Try to distribute the shifts evenly, so that each librarian works
+    his quota of shifts (or quota - 1) on the active or reserve locations
+    """
+    shifts = desk['shifts']
+    rules = desk['rules']
+    groups = desk['groups']
+    n_conditions = 0
+
+    weights = out_of_time_weights(desk['requests'], groups)
+
+    for n in range(shifts.shape[0]):
+        num_hours_worked = hours_at(desk, n, groups['active_locations'])
+        num_hours_reserve = hours_at(desk, n, groups['reserve_locations'])
+        quota_active = int(groups['quota_active'][n])
+        quota_reserve = int(groups['quota_reserve'][n])
+
+        if rules['noOutOfTimeShift']:
+            if not is_empty(shifts[n][weights[n] > 0]):
+                # Each shift out of the work hours (or during a meeting) counts
+                add_bound(desk, 'noOutOfTimeShift', total(shifts[n], weights[n]), 0, librarian=n)
+            n_conditions += 1
+        if rules['minActiveShifts']:
+            add_bound(desk, 'minActiveShifts', num_hours_worked, int(groups['min_active'][n]), at_most=False, librarian=n)
+            n_conditions += 1
+        if rules['minReserveShifts']:
+            add_bound(desk, 'minReserveShifts', num_hours_reserve, int(groups['min_reserve'][n]), at_most=False, librarian=n)
+            n_conditions += 1
+        if rules['maxActiveShifts']:
+            add_bound(desk, 'maxActiveShifts', num_hours_worked, quota_active, librarian=n)
+            n_conditions += 1
+        if rules['maxReserveShifts']:
+            add_bound(desk, 'maxReserveShifts', num_hours_reserve, quota_reserve, librarian=n)
+            n_conditions += 1
+        if rules['holidaySpecialQuota']:
+            add_bound(desk, 'holidaySpecialQuota', num_hours_worked, int(groups['min_holiday'][n]), at_most=False, librarian=n)
+            n_conditions += 1
+    return n_conditions
+
+
+# Rules that are emitted independently of each other, in model order
+rule_builders = [
+    ('oneLibrarianPerShift', add_one_librarian_per_shift),
+    ('oneShiftAtATime', add_one_shift_at_a_time),
+    ('maxTwoShiftsPerDay', add_max_two_shifts_per_day),
+    ('maxOneShiftPerDay', add_max_one_shift_per_day),
+    ('minOneShiftAverage', add_min_one_shift_average),
+    ('preferedRunLength', add_prefered_run_length),
+    ('maxOneLateShift', add_max_one_late_shift),
+    ('noSeventeenToTwenty', add_no_seventeen_to_twenty),
+    ('noTwelveToFourteen', add_no_twelve_to_fourteen),
+    ('maxDaysAtDesk', add_max_days_at_desk),
+]
+
+# Rules that are constraints of the model, hence can be soft
+constraint_names = [name for name, add_rule in rule_builders] + [
+    'noOutOfTimeShift', 'minActiveShifts', 'minReserveShifts', 'maxActiveShifts', 'maxReserveShifts',
+    'holidaySpecialQuota']
+
+# Every rule of the 'règles' sheet
+rule_names = constraint_names + ['ScaleQuotas', 'useAbsences', 'searchForAllSolutions']
+
+
+def penalty(desk):
+    """
+    Sum of the weights of the soft rules violated, per violation
+    """
+    if len(desk['penalties']) == 0:
+        return 0
+    violations = [violation for violation, weight in desk['penalties']]
+    weights = [weight for violation, weight in desk['penalties']]
+    return cp_model.LinearExpr.WeightedSum(violations, weights)
+
+
+def violated_rules(desk, solver):
+    """
+    (rule, scope, penalty) of the soft rules given up in the solution
+    """
+    values = solver.ResponseProto().solution
+    violated = []
+    for index, (rule, scope, weight) in desk['soft_rules'].items():
+        if values[index] > 0:
+            violated.append((rule, scope, weight * values[index]))
+    return violated
+
+
+def sector_scores(desk, sector_quotas):
+    """
+    sector_score[d][sector]: minutes worked by the librarians of each sector on day d
+    """
+    shifts = desk['shifts']
+    sectors = desk['groups']['sectors']
+    minutes = numpy.broadcast_to(desk['groups']['shift_minutes'][:, numpy.newaxis], shifts.shape[2:])
+    sector_score = []
+    for d in range(shifts.shape[1]):
+        sector_score.append({})
+        for sector in sector_quotas:
+            members = sectors.get(sector, [])
+            selection = shifts[members, d]
+            sector_score[d][sector] = total(selection, numpy.broadcast_to(minutes, selection.shape))
+    return sector_score
+
+
+def build_model(shift_requests, librarians, locations, quota, meeting_slots, rules, calendar, desk_shifts, scale, log_output,
+                quotas=None, last_shift_closed=True, metrics=None, rule_weights=None):
+    """
+    Create the CP-SAT model, its shift variables and the constraints of every selected rule
+    quotas: optional per-librarian {'quota_active', 'quota_reserve', 'quota_days'} arrays
+    replacing the quotas of the librarian types, and {'min_active', 'min_reserve', 'min_holiday'}
+    arrays replacing the minimum_targets() of the period
+    rule_weights: weights of the soft rules, subtracted from the objective when violated
+    """
+    model = cp_model.CpModel()
+
+    requests = numpy.asarray(shift_requests, dtype=numpy.int8)
+    desk = {
+        'model': model,
+        'requests': requests,
+        'librarians': librarians,
+        'locations': locations,
+        'rules': rules,
+        'desk_shifts': desk_shifts,
+        'scale': scale,
+        'log_output': log_output,
+        # literal index -> (rule, scope) of every assumption, see new_assumption()
+        'assumptions': {},
+        'rule_weights': rule_weights if rule_weights is not None else {},
+        # literal index -> (rule, scope, weight) of the soft rules, and their (literal, weight) penalty terms
+        'soft_rules': {},
+        'penalties': [],
+        'groups': index_groups(librarians, locations, quota, meeting_slots, calendar, desk_shifts, last_shift_closed),
+    }
+    desk['groups'].update(minimum_targets(desk['groups'], scale))
+    if quotas is not None:
+        desk['groups'].update(quotas)
+    desk['feasible'] = feasible_cells(requests, rules, desk['groups'], desk['rule_weights'])
+    desk['shifts'] = new_shift_variables(model, desk['feasible'])
+    desk['indices'] = shift_indices(desk['shifts'])
+    log_message(log_output, f"{numpy.count_nonzero(desk['feasible'])} shift variables created out of {requests.size} possible assignments")
+
+    # Let's see how many conditions we define
+    n_conditions = 0
+    for name, add_rule in rule_builders:
+        if rules[name]:
+            start = time.perf_counter()
+            n_conditions += add_rule(desk)
+            record_rule_time(metrics, name, time.perf_counter() - start)
+    start = time.perf_counter()
+    n_conditions += add_librarian_rules(desk)
+    record_rule_time(metrics, 'quotas and noOutOfTimeShift', time.perf_counter() - start)
+
+    # pylint: disable=g-complex-comprehension
+    desk['objective'] = total(desk['shifts'], requests) - penalty(desk)
+    model.Maximize(desk['objective'])
+    desk['n_conditions'] = n_conditions
+    return desk
+
+
+def add_solution_hints(desk, cells):
+    """
+    Hint the solver with a previous schedule: the given cells (n, d, s, lo) at 1,
+    every other shift variable at 0. Returns the cells that could not be hinted
+    because their variable was pruned.
+    """
+    model = desk['model']
+    shifts = desk['shifts']
+    hinted = numpy.zeros(shape=shifts.shape, dtype=bool)
+    pruned = []
+    for cell in cells:
+        if isinstance(shifts[cell], int):
+            pruned.append(cell)
+        else:
+            hinted[cell] = True
+    for n, d, s, lo in numpy.argwhere(desk['feasible']):
+        model.AddHint(shifts[n, d, s, lo], int(hinted[n, d, s, lo]))
+    return pruned
+
+
+def shift_indices(shifts):
+    """
+    Index in the model of the variable of each cell of shifts, -1 for the constant cells
+    """
+    indices = numpy.full(shape=shifts.shape, fill_value=-1, dtype=numpy.int64)
+    for cell in numpy.argwhere(numpy.frompyfunc(lambda x: not isinstance(x, int), 1, 1)(shifts).astype(bool)):
+        indices[tuple(cell)] = shifts[tuple(cell)].Index()
+    return indices
+
+
+def solution_array(solver, shifts, indices=None):
+    """
+    assignment[n, d, s, lo] = 1 if librarian n works shift s on day d at location lo,
+    read in one go from the solution vector of the response
+    """
+    if indices is None:
+        indices = shift_indices(shifts)
+    values = numpy.array(solver.ResponseProto().solution, dtype=numpy.int8)
+    assignment = numpy.zeros(shape=shifts.shape, dtype=numpy.int8)
+    variables = indices >= 0
+    assignment[variables] = values[indices[variables]]
+    return assignment
+
+
+def affected_days(desk, previous):
+    """
+    Days that a repair must re-optimize: a previous assignment is no longer
+    possible (new absence, changed hours...), or the previous schedule has
+    no assignment at all on that day
+    """
+    lost = (previous > 0) & ((~desk['feasible']) | (desk['requests'] == 0))
+    affected = lost.any(axis=(0, 2, 3)) | ~(previous > 0).any(axis=(0, 2, 3))
+    return [int(d) for d in numpy.flatnonzero(affected)]
+
+
+def repair_schedule(desk, previous, repair_days):
+    """
+    Keep the previous assignment on every day except repair_days, and re-optimize
+    those with the minimum number of changes (then the maximum of fulfilled requests)
+    """
+    model = desk['model']
+    shifts = desk['shifts']
+    requests = desk['requests']
+    repaired = numpy.zeros(shape=shifts.shape[1], dtype=bool)
+    repaired[repair_days] = True
+
+    for n, d, s, lo in numpy.argwhere(desk['feasible'] & ~repaired[numpy.newaxis, :, numpy.newaxis, numpy.newaxis]):
+        model.Add(shifts[n, d, s, lo] == int(previous[n, d, s, lo]))
+
+    selection = shifts[:, repaired]
+    kept = previous[:, repaired].astype(numpy.int64)
+    # changes = sum over the repaired days of |shift - previous|
+    changes = total(selection, 1 - 2 * kept) + int(kept.sum())
+    weight = selection.size + 1
+    model.Minimize(weight * changes - total(selection, requests[:, repaired]) + penalty(desk))
+    return add_solution_hints(desk, [tuple(cell) for cell in numpy.argwhere(previous > 0)])
@@ -1,26 +1,34 @@
 import hashlib
+import multiprocessing
 import os
 import sys
 import glob
 import pathlib
+import queue
+import threading
 import zipfile
 from pathlib import Path
 from ctypes.wintypes import MAX_PATH
 
 from tkinter import filedialog, messagebox
-from tkinter import Tk, Button, Label, font, StringVar, Checkbutton
+from tkinter import Tk, Button, Label, font, StringVar, Checkbutton, DISABLED, NORMAL
 
 from functools import partial
 from unicodedata import normalize
 
 from parse_absences import parse_absences
-from errors import error_output_header, init_error_log, log_error_message, get_stack_trace
+from errors import error_output_header, init_error_log, log_error_message, log_message, get_stack_trace, flush_logs, WARNING
+from run_control import new_run_control, report_progress, cancel_run, is_cancelled, RunCancelled
 import or_librarydesk_schedule
 
 version = "1.1"
 
 horaires = None
 absences = None
+run_control = None
+
+# Milliseconds between two reads of the progress of a run
+poll_interval = 200
 
 
 def get_horaire_file():
@@ -39,65 +47,131 @@ def get_absence_file():
         ('text files', '*.html'),
         ('All files', '*.*')
     )
-    d_title = "Choose the absences.epfl.ch file (saved HTML)"
-    absences = filedialog.askopenfilename(initialdir=Path.home(), filetypes=filetypes, title=d_title)
+    d_title = "Choose the absences.epfl.ch files (saved HTML, one per displayed period)"
+    # Several exports (e.g. July and August) are merged into one set of absences
+    absences = list(filedialog.askopenfilenames(initialdir=Path.home(), filetypes=filetypes, title=d_title))
+
+
+def run_pipeline(horaires, absences, log_output, error_output, run_control):
+    """
+    Worker thread: absences, then the schedule; the end of the run is posted to the UI queue
+    """
+    init_error_log(error_output)
+
+    outcome = ''
+    try:
+        if absences is not None:
+            if len(absences) > 0:
+                report_progress(run_control, 'stage', 'absences')
+                parse_absences(absences, log_output, error_output)
+
+        if horaires is not None:
+            or_librarydesk_schedule.main(horaires, log_output, error_output, run_control=run_control)
+        else:
+            log_error_message(log_output, 'Vous DEVEZ sélectionner un fichier XLSX contenant les horaires!')
+    except RunCancelled:
+        # Asked for by the user: not an error of the run
+        log_message(log_output, 'Run cancelled before a schedule was found', WARNING)
+        outcome = 'cancelled'
+    except Exception as e:
+        log_error_message(error_output, get_stack_trace(e))
+    flush_logs()
+    report_progress(run_control, 'done', outcome)
 
 
 def run_desk_schedule(tkroot, width_chars):
     global horaires
     global absences
+    global run_control
     print(horaires)
     print(absences)
+    if horaires is None:
+        messagebox.showerror(title='Horaires', message='Vous DEVEZ sélectionner un fichier XLSX contenant les horaires!')
+        return
     html_output = horaires.replace('.xlsx', '') + '.html'
     html_file = html_output.split(os.sep)[-1]
 
     log_output = horaires.replace('.xlsx', '') + '_log.txt'
-    log_file = log_output.split(os.sep)[-1]
 
     error_output = horaires.replace('.xlsx', '') + '_errors.txt'
     error_file = error_output.split(os.sep)[-1]
 
     error_message = f"There were errors or warnings during processing:\ncheck {error_file} for information."
 
-    init_error_log(error_output)
-    
-    if absences is not None:
-        if absences != '':
-            parse_absences(absences, log_output, error_output)
-
-    if horaires is not None:
-        try:
-            or_librarydesk_schedule.main(horaires, log_output, error_output)
-        except Exception as e:
-            log_error_message(error_output, get_stack_trace(e))
-    else:
-        log_error_message(log_output, 'Vous DEVEZ sélectionner un fichier XLSX contenant les horaires!')
-
-    f_err = open(error_output, "r")
-    error_content = f_err.read()
-    f_err.close()
-    
-    if error_content.replace('\r', '').replace('\n', '') == error_output_header.replace('\r', '').replace('\n', ''):
-        os.remove(error_output)
-        done_text = f'Done: {html_file} has been created.'
-        done_text += '\nCheck the logfile for more details'
-        done_info = Label(tkroot, text=done_text)
-        done_info.pack()
-
-    else:
-        error_info = Label(tkroot, text=error_message)
-        error_info.pack()
-
-root = Tk()
-current_font = font.nametofont("TkDefaultFont")
-root.wm_title("EPFL Library desk schedule v" + version)
-width = 400
-width_chars = int(1.7*width / current_font.actual()['size'])
-root.geometry(f'{width}x250+1000+300')
-
-Button(root, text="Sélection du fichier des horaires", command=get_horaire_file).pack()
-Button(root, text="Sélection du fichier des absences (optionnel)", command=get_absence_file).pack()
-
-button_label = 'Générer planning'
-Button(root, text=button_label, command=partial(run_desk_schedule, root, width_chars)).pack()
-root.mainloop()
+    # The run posts its progress here, the Tk thread reads it in poll_progress()
+    messages = queue.Queue()
+    run_control = new_run_control(lambda stage, message: messages.put((stage, message)))
+    generate_button.config(state=DISABLED)
+    cancel_button.config(state=NORMAL)
+    status_text.set('Démarrage...')
+    worker = threading.Thread(target=run_pipeline, args=(horaires, absences, log_output, error_output, run_control),
+                              daemon=True)
+    worker.start()
+
+    def run_done(outcome):
+        generate_button.config(state=NORMAL)
+        cancel_button.config(state=DISABLED)
+
+        f_err = open(error_output, "r")
+        error_content = f_err.read()
+        f_err.close()
+
+        if error_content.replace('\r', '').replace('\n', '') == error_output_header.replace('\r', '').replace('\n', ''):
+            os.remove(error_output)
+            if outcome == 'cancelled':
+                status_text.set('Cancelled: no schedule has been created.\nCheck the logfile for more details')
+                return
+            done_text = f'Done: {html_file} has been created.'
+            if is_cancelled(run_control):
+                done_text += '\n(cancelled: best schedule found so far)'
+            done_text += '\nCheck the logfile for more details'
+            status_text.set(done_text)
+
+        else:
+            status_text.set(error_message)
+
+    def poll_progress():
+        while True:
+            try:
+                stage, message = messages.get_nowait()
+            except queue.Empty:
+                break
+            if stage == 'done':
+                run_done(message)
+                return
+            elif stage == 'stage':
+                status_text.set(f'{message}...')
+            else:
+                status_text.set(f'solve: {message}')
+        tkroot.after(poll_interval, poll_progress)
+
+    tkroot.after(poll_interval, poll_progress)
+
+
+def cancel_desk_schedule():
+    if run_control is not None:
+        status_text.set('Annulation...')
+        cancel_run(run_control)
+
+
+if __name__ == '__main__':
+    # The absence exports are read in worker processes, which must not open a window
+    multiprocessing.freeze_support()
+    root = Tk()
+    current_font = font.nametofont("TkDefaultFont")
+    root.wm_title("EPFL Library desk schedule v" + version)
+    width = 400
+    width_chars = int(1.7*width / current_font.actual()['size'])
+    root.geometry(f'{width}x250+1000+300')
+
+    Button(root, text="Sélection du fichier des horaires", command=get_horaire_file).pack()
+    Button(root, text="Sélection des fichiers des absences (optionnel)", command=get_absence_file).pack()
+
+    button_label = 'Générer planning'
+    generate_button = Button(root, text=button_label, command=partial(run_desk_schedule, root, width_chars))
+    generate_button.pack()
+    cancel_button = Button(root, text='Annuler', command=cancel_desk_schedule, state=DISABLED)
+    cancel_button.pack()
+    status_text = StringVar()
+    Label(root, textvariable=status_text, wraplength=width - 20).pack()
+    root.mainloop()
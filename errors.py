@@ -1,5 +1,7 @@
+import atexit
 import os
 import sys
+import threading
 import traceback
 
 # error_output = "desk_schedule_errors.txt"
@@ -7,21 +9,85 @@ error_output_header = "This is the desk_schedule log for errors and warnings. Do
 
 # log_output = "desk_schedule_log.txt"
 
+# Log levels, as in the logging module
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+# Messages below this level are dropped; set_log_level(DEBUG) enables the detailed dumps
+log_level = INFO
+
+# One buffered handle per log file, kept open until flush_logs()/close_logs() or exit
+log_buffer_size = 1 << 16
+log_files = {}
+log_lock = threading.RLock()
+
+
+def set_log_level(level):
+    global log_level
+    log_level = level
+
+
+def debug_enabled():
+    """
+    Check this before building expensive debug messages
+    """
+    return log_level <= DEBUG
+
+
+def get_log_file(filename):
+    f_log = log_files.get(filename)
+    if f_log is None:
+        f_log = open(filename, "a", buffering=log_buffer_size)
+        log_files[filename] = f_log
+    return f_log
+
 
 def log_error_message(error_output, message):
-    f_err = open(error_output, "a")
-    f_err.write(message + '\n')
-    f_err.close()
+    # Errors are rare and the error log is read back by the UI: write them through
+    with log_lock:
+        f_err = get_log_file(error_output)
+        f_err.write(message + '\n')
+        f_err.flush()
 
 
-def log_message(log_output, message):
-    f_log = open(log_output, "a")
-    f_log.write(message + '\n')
-    f_log.close()
+def log_message(log_output, message, level=INFO):
+    if level < log_level:
+        return
+    with log_lock:
+        get_log_file(log_output).write(message + '\n')
+
+
+def log_debug(log_output, message):
+    log_message(log_output, message, DEBUG)
+
+
+def flush_logs():
+    with log_lock:
+        for f_log in log_files.values():
+            f_log.flush()
+
+
+def close_log(filename):
+    with log_lock:
+        f_log = log_files.pop(filename, None)
+        if f_log is not None:
+            f_log.close()
+
+
+def close_logs():
+    with log_lock:
+        for filename in list(log_files.keys()):
+            close_log(filename)
+
+
+atexit.register(close_logs)
 
 
 def init_error_log(error_output):
 	# delete existing logfile unless it doesn't exist
+    close_log(error_output)
     try:
         os.remove(error_output)
     except OSError:
@@ -40,6 +106,7 @@ def get_stack_trace(e):
 
 def init_main_log(log_output):
     # delete existing logfile unless it doesn't exist
+    close_log(log_output)
     try:
         os.remove(log_output)
     except OSError:
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import argparse
+import math
+import random
+from datetime import date, timedelta
+
+import openpyxl
+
+from desk_model import rule_names
+
+
+"""
+Write a synthetic Horaires-guichets workbook with the sheets read by
+read_work_schedules ('jours', 'shifts', 'guichets', 'quotas', 'séances',
+'guichetiers', 'règles'), without any personal data.
+Useful to measure how the scheduler scales, see benchmark.py.
+"""
+
+french_weekdays = ['lundi', 'mardi', 'mercredi', 'jeudi', 'vendredi', 'samedi', 'dimanche']
+
+location_names = ['Accueil', 'STM', 'Remplacement', 'Guichet 4', 'Guichet 5', 'Guichet 6']
+
+sectors = ['SOAR', 'AIR', 'CUBA', 'SPICE', 'USEP']
+
+# Rules of a first trial, see planning_semestre_howto.md
+default_rules = ['oneLibrarianPerShift', 'oneShiftAtATime', 'maxTwoShiftsPerDay', 'noOutOfTimeShift']
+
+# Library opening hours, in minutes
+day_start = 8 * 60
+day_end = 20 * 60
+
+
+def format_time(minutes):
+    if minutes % 60 == 0:
+        return f'{minutes // 60}h'
+    return f'{minutes // 60}h{minutes % 60:02d}'
+
+
+def business_days(start_date, num_days):
+    days = []
+    current_day = start_date
+    while len(days) < num_days:
+        if current_day.weekday() < 5:
+            days.append(current_day)
+        current_day += timedelta(days=1)
+    return days
+
+
+def random_availability(rng, shift_length, density):
+    """
+    Work hours of one day: None (not available), one interval or a morning and an afternoon
+    """
+    if rng.random() >= density:
+        return None
+    slots = (day_end - day_start) // shift_length
+    length = max(1, int(round(slots * rng.uniform(density, 1.0))))
+    first = rng.randint(0, slots - length)
+    start = day_start + first * shift_length
+    end = start + length * shift_length
+    if start < 12 * 60 and end > 13 * 60 and rng.random() < 0.3:
+        # lunch break
+        return f'{format_time(start)}-12h / 13h-{format_time(end)}'
+    return f'{format_time(start)}-{format_time(end)}'
+
+
+def generate_instance(filename, num_librarians=30, num_days=5, num_locations=3, shift_length=60, density=0.7,
+                      rules=None, start_date=None, seed=0, rule_weights=None):
+    """
+    Write the workbook and return its file name.
+    rules: names of the selected rules (default: the minimal rule set)
+    rule_weights: weights of the soft rules
+    """
+    rng = random.Random(seed)
+    if rules is None:
+        rules = default_rules
+    if rule_weights is None:
+        rule_weights = {}
+    if start_date is None:
+        start_date = date.today() + timedelta(days=7 - date.today().weekday())
+    days = business_days(start_date, num_days)
+
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+
+    sheet = wb.create_sheet('jours')
+    for k, day in enumerate(days):
+        sheet.append([k, f"{french_weekdays[day.weekday()]} {day.strftime('%d-%m-%Y')}"])
+
+    sheet = wb.create_sheet('shifts')
+    for start in range(day_start, day_end, shift_length):
+        sheet.append([format_time(start), format_time(min(shift_length, day_end - start))])
+
+    # The first location is open all day, the other ones during office hours
+    sheet = wb.create_sheet('guichets')
+    open_hours = []
+    for lo in range(num_locations):
+        if lo == 0:
+            hours = (day_start, day_end)
+        else:
+            hours = (day_start + shift_length, day_end - 3 * shift_length)
+        open_hours.append(hours)
+        name = location_names[lo] if lo < len(location_names) else f'Guichet {lo + 1}'
+        sheet.append([lo, name] + [f'{format_time(hours[0])}-{format_time(hours[1])}'] * num_days)
+
+    # Weekly quotas in hours, sized so that the staff can cover the open hours
+    weekly_hours = 5 * sum([(h[1] - h[0]) / 60 for h in open_hours])
+    per_librarian = max(2, math.ceil(1.5 * weekly_hours / max(1, num_librarians)))
+    types = {'100': 1.0, '80': 0.8, '50': 0.5}
+    sheet = wb.create_sheet('quotas')
+    for category, rate in types.items():
+        worked = max(1, int(round(per_librarian * rate)))
+        sheet.append([category, worked, max(1, worked // 3), 5])
+    sheet.append(['dir', max(1, per_librarian // 3), 1, 2])
+
+    sheet = wb.create_sheet('séances')
+    sheet.append(['dir', 3, '8h', '10h'])
+    for k, sector in enumerate(sectors):
+        meeting_start = 9 * 60 + 60 * (k % 4)
+        sheet.append([sector, k % 5, format_time(meeting_start), format_time(meeting_start + 60)])
+
+    sheet = wb.create_sheet('guichetiers')
+    for n in range(num_librarians):
+        availability = [random_availability(rng, shift_length, density) for d in range(num_days)]
+        librarian_type = 'dir' if n % 25 == 24 else rng.choice(list(types.keys()))
+        sheet.append([f'Guichetier {n + 1:03d}'] + availability + [None, sectors[n % len(sectors)],
+                     librarian_type, rng.choice([1, 1, 2])])
+
+    sheet = wb.create_sheet('règles')
+    for name in rule_names:
+        sheet.append([name, 1 if name in rules else 0, rule_weights.get(name)])
+
+    wb.save(filename)
+    return filename
+
+
+if __name__ == '__main__':
+    script_description = 'Generate a synthetic desk schedule workbook'
+    parser = argparse.ArgumentParser(description=script_description)
+    parser.add_argument('filename', help='XLSX file to write')
+    parser.add_argument('--librarians', type=int, default=30)
+    parser.add_argument('--days', type=int, default=5)
+    parser.add_argument('--locations', type=int, default=3)
+    parser.add_argument('--shift-length', type=int, default=60, help='in minutes')
+    parser.add_argument('--density', type=float, default=0.7, help='share of the days and hours the staff is available')
+    parser.add_argument('--rules', nargs='*', help=f'selected rules (default: {" ".join(default_rules)})')
+    parser.add_argument('--soft', nargs='*', default=[], help='soft rules and their weight, e.g. maxActiveShifts=10')
+    parser.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args()
+    rule_weights = {name: int(weight) for name, weight in [soft.split('=') for soft in args.soft]}
+    generate_instance(args.filename, args.librarians, args.days, args.locations, args.shift_length,
+                      args.density, args.rules, seed=args.seed, rule_weights=rule_weights)
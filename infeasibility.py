@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+from ortools.sat.python import cp_model
+import numpy
+
+from errors import log_message
+from desk_model import apply_solver_settings
+
+
+"""
+Explanation of an INFEASIBLE model. Every rule is enforced by assumption
+literals, one per librarian (or per day and shift for oneLibrarianPerShift),
+registered in desk['assumptions'] with their rule and scope. The core returned
+by the solver (the assumptions sufficient for infeasibility) is shrunk by
+solving again without parts of it, until every remaining rule is needed for
+the conflict, and then written out in plain language.
+"""
+
+# Time limit of each check while shrinking the core, in seconds
+check_time = 10.0
+
+# Search workers of each check, even on a single core: some of the portfolio's
+# strategies prove infeasibility in milliseconds where a single worker takes minutes
+check_workers = 8
+
+# At most this many checks: the core found so far is reported if the limit is reached
+max_checks = 200
+
+
+def check_assumptions(model, literals, solver_settings):
+    """
+    Status of the model with only the given assumptions, and the assumptions sufficient for infeasibility
+    """
+    model.ClearAssumptions()
+    model.Proto().assumptions.extend(literals)
+    solver = cp_model.CpSolver()
+    apply_solver_settings(solver, {k: v for k, v in solver_settings.items() if k == 'randomSeed'})
+    solver.parameters.num_workers = check_workers
+    solver.parameters.max_time_in_seconds = check_time
+    # Any solution shows that these rules can be satisfied together
+    solver.parameters.stop_after_first_solution = True
+    status = solver.Solve(model)
+    if status == cp_model.INFEASIBLE:
+        return status, set(solver.SufficientAssumptionsForInfeasibility())
+    return status, None
+
+
+def minimal_core(desk, core, solver_settings, log_output):
+    """
+    Shrink a core of assumption literals: drop chunks of it, halving the chunk size,
+    and keep them out whenever the rest is still infeasible.
+    Returns the core and whether it was proven minimal (no single rule can be dropped).
+    """
+    model = desk['model'].Clone()
+    # Feasibility is all that matters here
+    model.Proto().ClearField('objective')
+    core = list(core)
+    checks = 0
+    proven = True
+    chunk = max(len(core) // 2, 1)
+    while len(core) > 1:
+        k = 0
+        while k < len(core):
+            if checks >= max_checks:
+                log_message(log_output, f'Core shrinking stopped after {checks} checks, {len(core)} rules left')
+                return core, False
+            candidate = core[:k] + core[k + chunk:]
+            status, sufficient = check_assumptions(model, candidate, solver_settings)
+            checks += 1
+            if status == cp_model.INFEASIBLE:
+                # The solver may even point to a smaller part of the candidate
+                core = [literal for literal in candidate if literal in sufficient] if len(sufficient) > 0 else candidate
+            else:
+                if status != cp_model.FEASIBLE and status != cp_model.OPTIMAL and chunk == 1:
+                    # Time limit: the rule may not be needed, we just do not know
+                    proven = False
+                k += chunk
+        if chunk == 1:
+            break
+        chunk = max(chunk // 2, 1)
+    log_message(log_output, f'Core of {len(core)} rule(s) found in {checks} checks')
+    return core, proven
+
+
+def shift_time(shift):
+    hh, mm = divmod(shift[0], 60)
+    return f'{hh}h{mm:0>2}' if mm > 0 else f'{hh}h'
+
+
+def describe_core(desk, weekdays, core):
+    """
+    One phrase per rule and day of the core: "maxActiveShifts for Jane Doe, John Doe",
+    "oneLibrarianPerShift on lundi at 17h (2 location(s) to staff, 1 librarian(s) available)"...
+    Rules about librarians come first.
+    """
+    groups = {}
+    for literal in core:
+        rule, scope = desk['assumptions'][literal]
+        groups.setdefault((rule, scope.get('day')), []).append(scope)
+    phrases = []
+    for (rule, d), scopes in sorted(groups.items(), key=lambda item: (item[0][1] is not None, item[0][1] or 0)):
+        if d is None:
+            names = [desk['librarians'][scope['librarian']]['name'] for scope in scopes if 'librarian' in scope]
+            phrases.append(f"{rule} for {', '.join(names)}" if len(names) > 0 else rule)
+        else:
+            slots = []
+            for scope in sorted(scopes, key=lambda scope: scope['shift']):
+                s = scope['shift']
+                open_locations = numpy.count_nonzero(desk['groups']['open_slots'][d, s])
+                available = numpy.count_nonzero(desk['feasible'][:, d, s, :].any(axis=1))
+                slots.append(f"{shift_time(desk['desk_shifts'][s])} ({open_locations} location(s) to staff, {available} librarian(s) available)")
+            phrases.append(f"{rule} on {weekdays[d]} at {', '.join(slots)}")
+    return phrases
+
+
+def explain_infeasibility(desk, solver, solver_settings, weekdays, log_output):
+    """
+    Plain language explanation of an INFEASIBLE solve, one line per sentence
+    """
+    assumptions = desk['assumptions']
+    core = [literal for literal in solver.SufficientAssumptionsForInfeasibility() if literal in assumptions]
+    if len(core) == 0:
+        lines = ['The schedule is impossible whatever the selected rules.']
+    else:
+        log_message(log_output, f'{len(core)} rule(s) sufficient for infeasibility, looking for a minimal conflict')
+        core, proven = minimal_core(desk, core, solver_settings, log_output)
+        phrases = describe_core(desk, weekdays, core)
+        if len(phrases) == 1:
+            lines = [f'{phrases[0]} cannot be satisfied.']
+        else:
+            lines = [f"{phrases[0]} conflicts with {' and with '.join(phrases[1:])}."]
+        if not proven:
+            lines.append('Some of these rules may not be needed for the conflict (the search was stopped before the end).')
+        lines.append('Deselecting one of these rules, or changing the data they are about, removes this conflict; there may be others.')
+    if desk['rules']['noOutOfTimeShift']:
+        lines.append('With noOutOfTimeShift, librarians can only be assigned during their requested hours, outside of their meetings and absences.')
+    return lines
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+from datetime import date, datetime
+
+import numpy
+
+from errors import log_message, WARNING
+from read_work_schedule import read_workbook_tables, parse_tables, work_schedules, log_malformed, sheet_parsers, parser_version
+
+
+"""
+Cache of the parsed workbook, next to it in .desk_schedule_cache/: the
+availability tensors in <workbook>_<key>.npz, everything else in
+<workbook>.json. An unchanged workbook (same SHA-256, same parser_version) is
+loaded without opening it with openpyxl; otherwise only the sheets whose
+values, or the sheets they depend on, changed are parsed again. The cells that
+could not be read are kept too, and reported again on every run.
+"""
+
+cache_directory_name = '.desk_schedule_cache'
+
+
+def file_hash(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as fp:
+        for block in iter(lambda: fp.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def sheet_keys(tables):
+    """
+    One key per sheet, from its values and the keys of the sheets it depends on
+    """
+    keys = {}
+    for name, (dependencies, parser) in sheet_parsers.items():
+        digest = hashlib.sha256(f'{parser_version} {name}'.encode('utf-8'))
+        digest.update(repr(tables.get(name, [])).encode('utf-8'))
+        for dependency in dependencies:
+            digest.update(keys[dependency].encode('utf-8'))
+        keys[name] = digest.hexdigest()
+    return keys
+
+
+def encode(value):
+    """
+    JSON has neither tuples, dates nor non-string keys: tag them so that decode() gives back the same values
+    """
+    if isinstance(value, dict):
+        return {'__dict__': [[encode(k), encode(v)] for k, v in value.items()]}
+    if isinstance(value, tuple):
+        return {'__tuple__': [encode(v) for v in value]}
+    if isinstance(value, list):
+        return [encode(v) for v in value]
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, date):
+        return {'__date__': value.isoformat()}
+    if isinstance(value, numpy.generic):
+        return value.item()
+    return value
+
+
+def decode(value):
+    if isinstance(value, list):
+        return [decode(v) for v in value]
+    if isinstance(value, dict):
+        if '__dict__' in value:
+            return {decode(k): decode(v) for k, v in value['__dict__']}
+        if '__tuple__' in value:
+            return tuple(decode(v) for v in value['__tuple__'])
+        if '__datetime__' in value:
+            return datetime.fromisoformat(value['__datetime__'])
+        if '__date__' in value:
+            return date.fromisoformat(value['__date__'])
+    return value
+
+
+def cache_filenames(xlsx_filename, cache_directory=None):
+    if cache_directory is None:
+        cache_directory = os.path.join(os.path.dirname(os.path.abspath(xlsx_filename)), cache_directory_name)
+    base = os.path.basename(xlsx_filename).replace('.xlsx', '')
+    return cache_directory, os.path.join(cache_directory, base + '.json')
+
+
+def load_cache(index_filename):
+    """
+    Parsed sheets of the cache entry, or None if there is none or it was written by another parser version
+    """
+    try:
+        with open(index_filename, 'r') as fp:
+            index = json.load(fp)
+        if index.get('parser_version') != parser_version:
+            return None
+        sheets = {}
+        for name, sheet in index['sheets'].items():
+            sheets[name] = {'key': sheet['key'], 'value': decode(sheet['value']),
+                            'malformed': [tuple(cell) for cell in sheet['malformed']]}
+        if 'guichetiers' in sheets:
+            with numpy.load(os.path.join(os.path.dirname(index_filename), index['availability'])) as npz:
+                availability = npz['availability']
+            sheets['guichetiers']['value'] = (availability, sheets['guichetiers']['value'])
+        index['sheets'] = sheets
+        return index
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save_cache(cache_directory, index_filename, workbook_hash, keys, parsed, malformed):
+    os.makedirs(cache_directory, exist_ok=True)
+    availability, librarians = parsed['guichetiers']
+    # The file name changes with the contents, so that the index never points to a half written file
+    base = os.path.basename(index_filename).replace('.json', '')
+    availability_file = f"{base}_{keys['guichetiers'][:16]}.npz"
+    numpy.savez_compressed(os.path.join(cache_directory, availability_file), availability=availability)
+    sheets = {}
+    for name in sheet_parsers:
+        value = librarians if name == 'guichetiers' else parsed[name]
+        sheets[name] = {'key': keys[name], 'value': encode(value), 'malformed': malformed[name]}
+    index = {
+        'parser_version': parser_version,
+        'workbook_hash': workbook_hash,
+        'created': datetime.now().isoformat(),
+        'availability': availability_file,
+        'sheets': sheets,
+    }
+    temp_filename = index_filename + '.tmp'
+    with open(temp_filename, 'w') as fp:
+        json.dump(index, fp)
+    os.replace(temp_filename, index_filename)
+    for filename in os.listdir(cache_directory):
+        if filename.startswith(base + '_') and filename.endswith('.npz') and filename != availability_file:
+            os.remove(os.path.join(cache_directory, filename))
+
+
+def read_cached_work_schedules(xlsx_filename, log_output, error_output, cache_directory=None):
+    """
+    Same results as read_work_schedules, from the cache when possible
+    """
+    log_message(log_output, 'Input file: ' + xlsx_filename)
+    cache_directory, index_filename = cache_filenames(xlsx_filename, cache_directory)
+    workbook_hash = file_hash(xlsx_filename)
+    cache = load_cache(index_filename)
+    if cache is not None and cache['workbook_hash'] == workbook_hash:
+        log_message(log_output, f'Unchanged workbook, parsed inputs read from {index_filename}')
+        log_malformed(error_output, {name: sheet['malformed'] for name, sheet in cache['sheets'].items()})
+        return work_schedules({name: sheet['value'] for name, sheet in cache['sheets'].items()})
+
+    tables = read_workbook_tables(xlsx_filename, log_output)
+    keys = sheet_keys(tables)
+    parsed = {}
+    malformed = {}
+    if cache is not None:
+        for name in sheet_parsers:
+            if name in cache['sheets'] and cache['sheets'][name]['key'] == keys[name]:
+                parsed[name] = cache['sheets'][name]['value']
+                malformed[name] = cache['sheets'][name]['malformed']
+        changed = [name for name in sheet_parsers if name not in parsed]
+        log_message(log_output, f"Workbook changed, sheets parsed again: {', '.join(changed) if len(changed) > 0 else 'none'}")
+    parse_tables(tables, log_output, error_output, parsed, malformed)
+    try:
+        save_cache(cache_directory, index_filename, workbook_hash, keys, parsed, malformed)
+    except OSError as e:
+        log_message(log_output, f'Parsed inputs could not be cached: {e}', WARNING)
+    return work_schedules(parsed)
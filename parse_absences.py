@@ -1,10 +1,20 @@
+import os
 import sys
 
-from bs4 import BeautifulSoup
-import dateparser
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from lxml import etree
 import json
 
-from errors import log_message, log_error_message, get_stack_trace
+from errors import log_message, log_error_message, get_stack_trace, flush_logs, WARNING
+
+
+"""
+The planning page is read in one streaming pass (lxml iterparse): only the
+rows of the people table, the fc-day header and body cells and the timeline
+event harnesses are kept, every other element is discarded as soon as it is
+closed, so that the time and memory grow linearly with the size of the export.
+"""
 
 
 # From https://absences2.epfl.ch/home/plannings
@@ -13,126 +23,229 @@ from errors import log_message, log_error_message, get_stack_trace
 vacation = ('Vacances', 'Holidays', 'Compensation sur heures', 'Compensation - on hours')
 homeoffice = ('Télétravail', 'Teleworking')
 
-def get_all_text(node):
-    if node.nodeType == node.TEXT_NODE:
-        return node.text
-    else:
-        text_string = ""
-        for child_node in node.childNodes:
-            text_string += get_all_text(child_node)
-    return text_string
-
-
-def list_divs(node, ntabs=0):
-    all_subdivs = node.find_all('div')
-    subdivs = [div for div in all_subdivs if len(div.find_all('div')) > 0]
-    for subdiv in subdivs:
-        list_divs(subdiv, ntabs=ntabs+1)
-    #log_message(log_output, '\t'*ntabs + f'{len(subdivs)} subdivs')
-
-
-def parse_absences(htmlfile, log_output, error_output):
+# Position of the tables of the planning in the page (document order, nested tables included)
+people_table_index = 3
+absence_table_index = 5
+
+
+def element_classes(element):
+    return element.get('class', '').split()
+
+
+def element_text(element):
+    return ''.join(element.itertext()).strip()
+
+
+def parse_style(style):
+    """
+    'left: 120px; right: -240px' => {'left': '120px', 'right': '-240px'}
+    """
+    return {k.split(':')[0].strip(): k.split(':')[1].strip() for k in [x.strip() for x in style.split(';') if x.find(':') > 0]}
+
+
+def pixels(value):
+    return int(float(value.replace('px', '')))
+
+
+def discard(element):
+    """
+    Free a closed element and its already processed previous siblings
+    """
+    element.clear()
+    parent = element.getparent()
+    if parent is not None:
+        while element.getprevious() is not None:
+            del parent[0]
+
+
+def scan_planning(htmlfile):
+    """
+    One pass over the page: people, known days, number of day cells, width of the absence table
+    and events (row, left, right, reason) of the absence table
+    """
+    librarians = []
+    known_days = []
+    day_cells = 0
+    total_width = None
+    events = []
+    # Index of the enclosing tables, innermost last, and current row of the absence table
+    tables = []
+    table_count = 0
+    absence_row = -1
+    for event, element in etree.iterparse(htmlfile, events=('start', 'end'), html=True, huge_tree=True,
+                                          encoding='utf-8'):
+        tag = element.tag
+        if event == 'start':
+            if tag == 'table':
+                tables.append(table_count)
+                if table_count == absence_table_index and 'fc-scrollgrid-sync-table' in element_classes(element):
+                    styles = parse_style(element.get('style', ''))
+                    if 'min-width' in styles:
+                        total_width = pixels(styles['min-width'])
+                table_count += 1
+            elif tag == 'tr' and len(tables) > 0 and tables[-1] == absence_table_index:
+                absence_row += 1
+            continue
+        if tag == 'table':
+            tables.pop()
+        elif tag == 'tr' and len(tables) > 0 and tables[-1] == people_table_index:
+            librarians.append(element_text(element))
+            discard(element)
+        elif tag == 'th' and 'fc-day' in element_classes(element):
+            if element.get('colspan') == '1':
+                known_days.append(element.get('data-date'))
+            discard(element)
+        elif tag == 'td' and 'fc-day' in element_classes(element):
+            day_cells += 1
+            discard(element)
+        elif tag == 'div' and 'fc-timeline-event-harness' in element_classes(element):
+            styles = parse_style(element.get('style', ''))
+            events.append((absence_row, pixels(styles['left']), pixels(styles['right']), element_text(element)))
+            discard(element)
+        elif tag == 'tr':
+            discard(element)
+    return librarians, known_days, day_cells, total_width, events
+
+
+def read_planning(htmlfile, log_output, error_output):
+    """
+    Leave intervals per person of one export, and what it covers:
+    {'Name': [(first day, last day), ...]}, {'file', 'people', 'first_day', 'last_day'}
+    """
     log_message(log_output, f'Will read absences from {htmlfile}')
-    HTMLFile = open(htmlfile, "r")
-    index = HTMLFile.read()
-
-    S = BeautifulSoup(index, 'lxml')
+    vacation_data = {}
+    coverage = {'file': htmlfile, 'people': [], 'first_day': None, 'last_day': None}
     try:
         log_message(log_output, 'parse_absences')
-        tables = S.find_all('table')
-        log_message(log_output, f'Found {len(tables)} tables in the page.')
-
-        for idx, t in enumerate(tables):
-            subtables = t.find_all('table')
-            rows = t.find_all('tr')
-            log_message(log_output, f'Table {idx} has {len(rows)} rows and contains {len(subtables)} sub-tables')
-            log_message(log_output, f"Is FV there? {t.decode_contents().find('Varrato')}")
-            log_message(log_output, "Is Holidays there? {t.decode_contents().find('Holidays')}")
-            for ridx, r in enumerate(rows):
-                cols = r.find_all('td')
-                if len(cols) == 1:
-                    if get_all_text(cols[0]) is None:
-                        log_message(log_output, 'Weird column:')
-                    else:
-                        pass
-                else:
-                    log_message(log_output, f'\tRow {ridx} has {len(cols)} columns')
-            if 'fc-scrollgrid-sync-table' in t.get('class'):
-                log_message(log_output, f"{[x.strip() for x in t.get('style').split(';') if x.find(':') > 0]}")
-                styles = {k.split(':')[0].strip(): k.split(':')[1].strip() for k in [x.strip() for x in t.get('style').split(';') if x.find(':') > 0]}
-                log_message(log_output, f'{styles}')
-                if 'min-width' in styles:
-                    total_width = styles['min-width']
-                    log_message(log_output, f'Total absence table width {total_width}')
-
-        log_message('---------')
-        people_table = tables[3]
-        log_message(log_output, f"Is FV really in there? {people_table.decode_contents().find('Varrato')}")
-        people_rows = people_table.find_all('tr')
-        librarians = [get_all_text(row).strip() for row in people_rows]
-
-        fcDayThs = [th for th in S.find_all('th', class_='fc-day') if th.get('colspan') == '1']
-        for th in fcDayThs:
-            log_message(log_output, f"{[th.get('colspan')]}, {get_all_text(th)}, {th.get('data-date')}")
-        known_days = [th.get('data-date') for th in fcDayThs]
-        fcDayTds = S.find_all('td', class_='fc-day')
-        log_message(log_output, f'Found {len(fcDayTds)} days')
-        fcDayTds = S.find_all('td', class_='fc-day')
-
-        absence_table = tables[5]
-        
-        if 'fc-scrollgrid-sync-table' in absence_table.get('class'):
-            style_list = [x.strip() for x in absence_table.get('style').split(';') if x.find(':') > 0]
-            styles = {k.split(':')[0].strip(): k.split(':')[1].strip() for k in style_list}
-            log_message(log_output, f'{styles}')
-            if 'min-width' in styles:
-                total_width = styles['min-width']
-                log_message(log_output, f"Total absence table width {int(total_width.replace('px', ''))}")
-                day_width = int(total_width.replace('px', '')) // len(fcDayTds)
-                log_message(log_output, f'One day should be {day_width} pixels')
-
-        absence_rows = absence_table.find_all('tr')
+        librarians, known_days, day_cells, total_width, events = scan_planning(htmlfile)
+        log_message(log_output, f'Found {len(librarians)} people and {day_cells} days ({known_days[0]} - {known_days[-1]})')
+        log_message(log_output, f'Total absence table width {total_width}')
+        # Not rounded: a one-day leave must not end before its first day
+        day_width = total_width / day_cells
+        log_message(log_output, f'One day should be {day_width} pixels')
+
+        vacation_data = {name: [] for name in librarians}
+        for ridx, left, right, reason in events:
+            # Events starting before or ending after the displayed period are cut to it
+            start = max(round(left / day_width), 0)
+            end = min(round(abs(right) / day_width) - 1, len(known_days) - 1)
+            if start > end:
+                # Entirely outside of the displayed period
+                continue
+            if reason not in homeoffice:
+                log_message(log_output, f'{librarians[ridx]} is on leave ({reason}) from {known_days[start]} to {known_days[end]}')
+                vacation_data[librarians[ridx]].append((known_days[start], known_days[end]))
+            else:
+                log_message(log_output, f'{librarians[ridx]} is away from work due to {reason} from {known_days[start]} to {known_days[end]}')
+        coverage.update({'people': librarians, 'first_day': known_days[0], 'last_day': known_days[-1]})
+
+    except (IndexError, TypeError, ZeroDivisionError) as e:
         vacation_data = {}
-        for ridx, row in enumerate(absence_rows):
-            cells = row.find_all('td')
-            log_message(f'{len(cells)}')
-            if (len(cells) > 0):
-                log_message(f'{cells[0].class_}')
-                #print(cells[0].decode_contents())
-                all_divs = cells[0].find_all('div')
-                inner_divs = [div for div in all_divs if len(div.find_all('div')) == 0]
-                events = [div for div in all_divs if 'fc-timeline-event-harness' in div.get('class')]
-                log_message(f'{len(events)} events')
-                log_message(f"{librarians[ridx]}, {len(inner_divs)}, {[(div.get('class'), get_all_text(div).strip(), div.get('style')) for div in events]}")
-                vacation_data[librarians[ridx]] = []
-                for event in events:
-                    event_style_list = [x.strip() for x in event.get('style').split(';') if x.find(':') > 0]
-                    styles = {k.split(':')[0].strip(): k.split(':')[1].strip() for k in event_style_list}
-                    start = int(styles['left'].replace('px', '')) // day_width
-                    end = abs(int(styles['right'].replace('px', ''))) // day_width - 1
-                    reason = get_all_text(event).strip()
-                    if reason not in homeoffice:
-                        log_message(log_output, f'{librarians[ridx]} is on leave ({reason}) from {known_days[start]} to {known_days[end]}')
-                        vacation_data[librarians[ridx]].append((known_days[start], known_days[end]))
-                    else:
-                        log_message(log_output, f'{librarians[ridx]} is away from work due to {reason} from {known_days[start]} to {known_days[end]}')
-        with open('vacation.json', 'w') as fp:
-            json.dump(vacation_data, fp)
-
-    except IndexError as e:
-        log_error_message(error_output, 'no table found?')
+        log_error_message(error_output, f'{htmlfile}: no table found?')
         log_error_message(error_output, get_stack_trace(e))
     except Exception as e:
-        log_error_message(error_output, 'Something went really wrong')
+        vacation_data = {}
+        log_error_message(error_output, f'{htmlfile}: something went really wrong')
         log_error_message(error_output, get_stack_trace(e))
+    # Worker processes exit without running atexit handlers
+    flush_logs()
+    return vacation_data, coverage
+
+
+def absence_files(sources):
+    """
+    Exports to read: a file, a directory (all its .html/.htm files) or a list of both
+    """
+    if isinstance(sources, str):
+        sources = [sources]
+    files = []
+    for source in sources:
+        if os.path.isdir(source):
+            files += sorted([os.path.join(source, name) for name in os.listdir(source)
+                             if name.lower().endswith(('.html', '.htm'))])
+        else:
+            files.append(source)
+    return files
+
+
+def merge_leaves(leaves):
+    """
+    Overlapping, adjacent and repeated leaves merged, in date order
+    """
+    merged = []
+    for first, last in sorted([(date.fromisoformat(first), date.fromisoformat(last)) for first, last in leaves]):
+        if len(merged) > 0 and first <= merged[-1][1] + timedelta(days=1):
+            merged[-1][1] = max(merged[-1][1], last)
+        else:
+            merged.append([first, last])
+    return [(first.isoformat(), last.isoformat()) for first, last in merged]
+
+
+def log_coverage(coverages, log_output, error_output):
+    """
+    People and dates of each export, people missing from some exports and days no export covers
+    """
+    everyone = set()
+    days = set()
+    for coverage in coverages:
+        if coverage['first_day'] is None:
+            log_message(log_output, f"{coverage['file']}: nothing read")
+            continue
+        first = date.fromisoformat(coverage['first_day'])
+        last = date.fromisoformat(coverage['last_day'])
+        log_message(log_output, f"{coverage['file']}: {len(coverage['people'])} people, {first} - {last}")
+        everyone.update(coverage['people'])
+        days.update([first + timedelta(days=k) for k in range((last - first).days + 1)])
+    for coverage in coverages:
+        missing = sorted(everyone - set(coverage['people']))
+        if coverage['first_day'] is not None and len(missing) > 0:
+            log_message(log_output, f"{coverage['file']} does not list {', '.join(missing)}", WARNING)
+    if len(days) > 0:
+        first = min(days)
+        gaps = [(first + timedelta(days=k)).isoformat() for k in range((max(days) - first).days + 1) if first + timedelta(days=k) not in days]
+        for gap_first, gap_last in merge_leaves([(day, day) for day in gaps]):
+            log_error_message(error_output, f'No absence export covers {gap_first} - {gap_last}')
+
+
+def parse_absences(htmlfiles, log_output, error_output, vacation_file='vacation.json', workers=None):
+    """
+    Leave intervals per person of one or several exports (files, directories), read in parallel,
+    merged and written to vacation_file, and returned:
+    {'Name': [(first day, last day), ...]}, days as in the data-date of the pages
+    """
+    files = absence_files(htmlfiles)
+    if workers is None:
+        workers = os.cpu_count()
+    workers = max(1, min(workers, len(files)))
+    if workers > 1:
+        log_message(log_output, f'Reading {len(files)} absence exports with {workers} worker processes')
+        # The workers must not inherit, and write again, what is still buffered
+        flush_logs()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(read_planning, files, [log_output] * len(files), [error_output] * len(files)))
+    else:
+        results = [read_planning(htmlfile, log_output, error_output) for htmlfile in files]
+
+    vacation_data = {}
+    for file_data, coverage in results:
+        for name, leaves in file_data.items():
+            vacation_data.setdefault(name, []).extend(leaves)
+    vacation_data = {name: merge_leaves(leaves) for name, leaves in vacation_data.items()}
+    if len(files) > 1:
+        log_coverage([coverage for file_data, coverage in results], log_output, error_output)
+        log_message(log_output, f'{len(vacation_data)} people, {sum([len(leaves) for leaves in vacation_data.values()])} leaves after merging {len(files)} exports')
+    if any(coverage['first_day'] is not None for file_data, coverage in results):
+        with open(vacation_file, 'w') as fp:
+            json.dump(vacation_data, fp)
+    return vacation_data
 
 
 if __name__ == "__main__":
     if len(sys.argv) > 1:
-        htmlfile = sys.argv[1]
+        htmlfiles = sys.argv[1:]
     else:
-        htmlfile = "absences.html"
+        htmlfiles = "absences.html"
     log_output = 'parse_absences_log.txt'
     error_output = 'parse_absences_errors.txt'
 
-    output = parse_absences(htmlfile, log_output, error_output)
+    output = parse_absences(htmlfiles, log_output, error_output)
@@ -5,10 +5,11 @@ import sys
 import numpy
 import dateutil.parser
 import openpyxl
+from bisect import bisect_left, bisect_right
 
-from inspect import currentframe, getframeinfo
-
-from errors import log_message, log_error_message, get_stack_trace
+from errors import log_message, log_error_message, get_stack_trace, log_debug, debug_enabled, WARNING
+from desk_model import solver_parameters, location_open_slots, constraint_names
+from time_ranges import parse_time, parse_time_ranges, is_time_cell, available_slots
 
 # TODO replace with values determined by the defined locations
 #max_shift = 10
@@ -31,311 +32,362 @@ meeting_slots = {
 
 # IDEA 2022-02-25 what if we used non-integer hours? Start at 8:30 for example?
 
-def read_work_schedules(xlsx_filename, log_output, error_output):
-    log_message(log_output, 'Input file: ' + xlsx_filename)
-    wb_obj = openpyxl.load_workbook(xlsx_filename)
+def read_tables(wb_obj, log_output):
+    """
+    Values of all the sheets in a single pass, as lists of row tuples; rows with an empty first cell are dropped
+    """
+    tables = {}
+    for sheet in wb_obj.worksheets:
+        rows = []
+        for cells in sheet.iter_rows(values_only=True):
+            if len(cells) > 0 and cells[0] is not None:
+                rows.append(cells)
+        tables[sheet.title] = rows
+    log_debug(log_output, f'Sheets: {[(name, len(rows)) for name, rows in tables.items()]}')
+    return tables
+
+
+def padded(cells, width):
+    """
+    Read-only sheets only return the cells up to the last used column
+    """
+    if len(cells) < width:
+        return cells + (None,) * (width - len(cells))
+    return cells
 
-    sheet = wb_obj['jours']
+
+def parse_days(rows, parsed, report, log_output):
     weekdays = {}
     max_day = None
-    for row in sheet.iter_rows():
-        if len(row) > 0:
-            if row[0] is not None:
-                cells = [cell.value for cell in row]
-                if cells[0] is not None:
-                    try:
-                        number = int(cells[0])
-                    except ValueError:
-                        pass
-                    value = cells[1]
-                    weekdays[number] = value
-    max_day = number + 1
+    for cells in rows:
+        cells = padded(cells, 2)
+        try:
+            number = int(cells[0])
+        except ValueError:
+            report(cells[0], 'A', cells[0], 'not a day number')
+            continue
+        weekdays[number] = cells[1]
+    max_day = len(weekdays.keys())
     log_message(log_output, f'{max_day} days, namely:  {weekdays}')
+    return weekdays
+
 
-    # Definition of daily shifts
-    sheet = wb_obj['shifts']
+def parse_shifts(rows, parsed, report, log_output):
+    """
+    Definition of daily shifts: (start, length) in minutes
+    """
     shifts = []
-    for row in sheet.iter_rows():
-        if len(row) > 0:
-            if row[0] is not None:
-                cells = [cell.value for cell in row]
-                if cells[0] is not None:
-                    parsed_cell = cells[0].replace('h', ':').split(':')
-                    time = int(parsed_cell[0]) * 60
-                    try:
-                        time += int(parsed_cell[1])
-                    except (IndexError, ValueError) as e:
-                        pass
-                    try:
-                        parsed_cell = cells[1].replace('h', ':').split(':')
-                        value = int(parsed_cell[0]) * 60
-                        try:
-                            value += int(parsed_cell[1])
-                        except (IndexError, ValueError) as e:
-                            pass
-                    except ValueError:
-                        value = 0
-                    # log_message(log_output, cells, time, value)
-                    shifts.append((time, value))
+    for cells in rows:
+        cells = padded(cells, 2)
+        try:
+            start = parse_time(cells[0])
+        except ValueError as e:
+            report(cells[0], 'start', cells[0], f'{e}')
+            continue
+        try:
+            length = parse_time(cells[1])
+        except ValueError as e:
+            report(cells[0], 'length', cells[1], f'{e}')
+            length = 0
+        shifts.append((start, length))
     log_message(log_output, 'Shift definitions: ' + str(shifts))
-    max_shift = len(shifts)
-    shift_starts = [x[0] for x in shifts]
+    return shifts
 
-    # Get locations from relevant sheet
-    sheet = wb_obj['guichets']
+
+def parse_locations(rows, parsed, report, log_output):
+    weekdays = parsed['jours']
+    shifts = parsed['shifts']
+    shift_starts = [x[0] for x in shifts]
+    shift_ends = [x[0] + x[1] for x in shifts]
     locations = {}
-    for row in sheet.iter_rows():
-        if len(row) > 0:
-            cells = [cell.value for cell in row]
-            log_message(log_output, f'guichets tab cells: {cells}')
-            if cells[0] is not None:
-                name = cells[1]
-                locations[cells[0]] = {'name': cells[1], 'times': {}}
-                day = -1
-                for x in cells[2:2+len(weekdays.keys())]:
-                    day += 1
-                    times = []
-                    if x is None or not x[0].isdigit():
-                        log_message(log_output, f'{x} is not a time')
-                    else:
-                        location_hours = x.split('-')
-                        for l in location_hours:
-                            hh = int(l.lower().split('h')[0])*60
-                            mm = l.lower().split('h')[1]
-                            if len(mm) > 0:
-                                mm = int(mm)
-                            else:
-                                mm = 0
-                            times.append(hh)
-                        #log_message(log_output, 'stuff: ', times, shifts, [x[0] for x in shifts if x[0] <= times[0]])
-                        #log_message(log_output, [(x[0], x[0] + x[1], times[1]) for x in shifts ])
-                        absolute_times = (max([x[0] for x in shifts if x[0] <= times[0]]),
-                                          min([x[0] for x in shifts if x[0] + x[1] >= times[1]]))
-                    log_message(log_output, 'Absolute times (minutes): ' + str(absolute_times))
-                    locations[cells[0]]['times'][day] = {'start': shift_starts.index(absolute_times[0]),
-                        'end': shift_starts.index(absolute_times[1])}
-
-    sheet = wb_obj['quotas']
+    for cells in rows:
+        cells = padded(cells, 2 + len(weekdays.keys()))
+        log_debug(log_output, f'guichets tab cells: {cells}')
+        locations[cells[0]] = {'name': cells[1], 'times': {}}
+        # Whole day unless a previous day says otherwise
+        times = {'start': 0, 'end': len(shifts) - 1}
+        for day, x in enumerate(cells[2:2+len(weekdays.keys())]):
+            try:
+                # Opening hours count in whole hours, as they always have: "8h30-17h30" is 8h-17h
+                opening, closing = [t - t % 60 for t in parse_time_ranges(x)[0]]
+            except ValueError as e:
+                report(cells[1], weekdays[day], x, f"{e}, hours of the previous day used")
+            else:
+                # Shifts overlapping the opening hours
+                times = {'start': max(bisect_right(shift_starts, opening) - 1, 0),
+                         'end': min(bisect_left(shift_ends, closing), len(shifts) - 1)}
+            log_debug(log_output, 'Location slots: ' + str(times))
+            locations[cells[0]]['times'][day] = dict(times)
+    log_message(log_output, str(locations))
+    log_message(log_output, f'{len(locations.keys())} {len(shifts)}')
+    return locations
+
+
+def parse_quotas(rows, parsed, report, log_output):
     quota = {}
-    for row in sheet.iter_rows():
-        if len(row) > 0:
-            cells = [cell.value for cell in row]
-            log_message(log_output, f'{cells}')
-            if cells[0] is not None:
-                cells = [cell.value for cell in row]
-                category = cells[0]
-                # 2022-05-23 scale up or down if we deal with periods different from 1 business week
-                worked = int(cells[1])
-                reserve = int(cells[2])
-                max_days = int(cells[3])
-                quota[category] = (worked, reserve, max_days)
+    for cells in rows:
+        cells = padded(cells, 4)
+        log_debug(log_output, f'{cells}')
+        category = cells[0]
+        # 2022-05-23 scale up or down if we deal with periods different from 1 business week
+        try:
+            quota[category] = (int(cells[1]), int(cells[2]), int(cells[3]))
+        except (TypeError, ValueError):
+            report(category, 'B-D', cells[1:4], 'quotas must be whole numbers')
+    return quota
 
-    log_message(log_output, str(locations))
-    max_location = len(locations.keys())
-    log_message(log_output, f'{max_location} {max_shift}')
 
-    sheet = wb_obj['séances']
+def parse_meetings(rows, parsed, report, log_output):
+    shift_starts = [x[0] for x in parsed['shifts']]
     meeting_slots = {}
-    # TEST does this work with 2h shifts?
     # We want the first and last **unavailable** slots
-    for row in sheet.iter_rows():
-        if len(row) > 0:
-            if row[0] is not None:
-                cells = [cell.value for cell in row]
-                if cells[0] is not None:
-                    group = cells[0]
-                    day = cells[1]     
-                    times = []
-                    ktimes = -1               
-                    for x in cells[2:4]:
-                        #log_message(log_output, cells[2:4], cells[2], cells[3], x)
-                        ktimes += 1
-                        if x is None or not x[0].isdigit():
-                            log_message(log_output, f'{x} is not a time')
-                        else:
-                            # log_message(log_output, [x, x.lower().split('h')])
-                            hh = int(x.lower().split('h')[0])*60
-                            minutes = x.lower().split('h')[1]
-                            if len(minutes) == 0:
-                                minutes = '0'
-                            mm = int(minutes)
-                            log_message(log_output, f'{group} meeting: {hh + mm}, {[x[0] for x in shifts if x[0] <= hh + mm]}')
-                            if len([x[0] for x in shifts if x[0] <= hh + mm]) > 0:
-                                times.append(max([x[0] for x in shifts if x[0] <= hh + mm]))
-                                times.append(min([x[0] for x in shifts if x[0] >= hh + mm]))
-                            else:
-                                #log_message(log_output, min(shifts))
-                                times.append(min([x[0] for x in shifts]))
-                                times.append(min([x[0] for x in shifts]))
-                            if times[-1] > shifts[-1][0]:
-                                pass
-                    log_message(log_output, f'{group} meeting times on day {day}: {times}')
-                    log_message(log_output, f'{group} meeting shifts on day {day}: {shifts}')
-
-                    meeting_slots[group] = (day, [x[0] for x in shifts].index(times[0]), [x[0] for x in shifts].index(times[3]) -1)
-
-    sheet = wb_obj['guichetiers']
-    n = -1
-    availability = []
+    for cells in rows:
+        cells = padded(cells, 4)
+        group = cells[0]
+        day = cells[1]
+        try:
+            start = parse_time(cells[2])
+            end = parse_time(cells[3])
+        except ValueError as e:
+            report(group, 'start-end', cells[2:4], f'{e}, meeting ignored')
+            continue
+        # from the shift in progress at the start to the shift before the first one starting at or after the end
+        start_slot = max(bisect_right(shift_starts, start) - 1, 0)
+        end_slot = bisect_left(shift_starts, end) - 1 if end > shift_starts[0] else -1
+        log_message(log_output, f'{group} meeting times on day {day}: {start}-{end}')
+        meeting_slots[group] = (day, start_slot, end_slot)
+    return meeting_slots
+
+
+def parse_librarians(rows, parsed, report, log_output):
+    """
+    Librarians and their availability[n, d, s, lo]
+    """
+    weekdays = parsed['jours']
+    max_day = len(weekdays.keys())
+    shifts = parsed['shifts']
+    max_shift = len(shifts)
+    max_location = len(parsed['guichets'].keys())
+    shift_starts = [x[0] for x in shifts]
+    last_end = shifts[-1][0] + shifts[-1][1]
+
     librarians = {}
-    for row in sheet.iter_rows():
-        if len(row) > 0:
-            if row[0] is not None:
-                cells = [cell.value for cell in row]
-                if cells[0] is not None:
-                    name = cells[0].strip()
-                    log_message(log_output, name)
-                    n += 1
-                    librarians[n] = {'name': name}
-                    librarians[n]['sector'] = cells[max_day+2].strip()
-                    # we must accept integers and convert to string if necessary
-                    librarians[n]['type'] = f'{cells[max_day+3]}'.strip()
-                    librarians[n]['prefered_length'] = cells[max_day+4]
-                    # TODO replace fixed constants!
-                    new_roster = numpy.zeros(shape=(max_day, max_shift, max_location), dtype=numpy.int8)
-                    d = -1
-                    # Extract extended work hours; skip comment columns
-                    for x in cells[1:1+max_day]:
-                        # TODO probably not valid for 2h shifts
-                        # new day
-                        d += 1
-                        if x is None or not x[0].isdigit():
-                            log_message(log_output, f'{x} is not a time')
-                        else:
-                            if not x[-1].isdigit():
-                                x += '00'
-                            x = x.lower().replace('/', '-').replace("–", "-").replace(';','-')
-                            x = x.replace('.', 'h').replace(':', 'h').replace('hh', 'h').replace('h-', 'h00-')
-                            boundaries = [b.strip() for b in x.split('-')]
-                            if len(boundaries) < 2:
-                                # something unexpected was found, boundaries were not read properly
-                                log_message(error_output, f'WTF {x}')
-                                log_error_message(error_output, f'WTF {x}')
-                            else:
-                                log_message(log_output, f'Boundaries: {boundaries}')
-                                int_boundaries = []
-                                # rules:
-                                # - start time: if minutes are non-zero, round up
-                                # - end time: if minutes are non-zero, round down
-                                # also: remove 1 from end time to get the beginning of the last slot
-                                k = 0
-                                for b in boundaries:
-                                    split_b = b.strip().split('h')
-                                    exact_time = int(split_b[0]) * 60
-                                    try:
-                                        exact_time += int(split_b[1])
-                                    except (IndexError, ValueError) as e:
-                                        pass
-
-                                    int_boundaries.append(exact_time)
-                                    k += 1
-                                #log_message(log_output, 'int_boundaries: ', int_boundaries)
-                                for slot in range(len(int_boundaries) // 2):
-                                    # for special vacation times, a possible staffmember slot could en before
-                                    # the shifts begin...
-                                    if int_boundaries[slot*2+1] <= min([x[0] for x in shifts]):
-                                        continue
-                                    # Or the end of the last shift could take place before  slot begins
-                                    if int_boundaries[slot*2] >= max([x[0] for x in shifts]):
-                                        continue
-
-                                    if shifts[0][0] <= int_boundaries[slot*2]:
-                                        lower_time = min([x[0] for x in shifts if x[0] >= int_boundaries[slot*2]])
-                                    else:
-                                        lower_time = shifts[0][0]
-                                    lower_slot = [x[0] for x in shifts].index(lower_time)
-
-                                    # log_message(log_output, int_boundaries[slot*2+1],  [x[0] for x in shifts])
-                                    upper_time = max([x[0] for x in shifts if x[0] <= int_boundaries[slot*2+1]])
-                                    # the last 100% possible slot is one below
-                                    upper_slot = [x[0] for x in shifts].index(upper_time) - 1
-                                    # unless we are beyond the end of the last shiift
-                                    if int_boundaries[slot*2+1] >= shifts[-1][0] + shifts[-1][1]:
-                                        upper_slot += 1
-
-                                    #log_message(log_output, f'lower-upper: {lower_time}-{upper_time}')
-                                    log_message(log_output, f'lower-upper: ({lower_slot})-({upper_slot})')
-                                    k = lower_slot
-                                    while k <= upper_slot:
-                                        # log_message(log_output, [d, k])
-                                        for lo in range(max_location):
-                                            new_roster[d][k][lo] = 1
-                                        k += 1
-            
-                    availability.append(new_roster)
-        else:
-            break
+    availability = numpy.zeros(shape=(len(rows), max_day, max_shift, max_location), dtype=numpy.int8)
+    for n, cells in enumerate(rows):
+        cells = padded(cells, max_day + 5)
+        name = f'{cells[0]}'.strip()
+        log_debug(log_output, name)
+        librarians[n] = {'name': name}
+        librarians[n]['sector'] = f'{cells[max_day+2]}'.strip()
+        # we must accept integers and convert to string if necessary
+        librarians[n]['type'] = f'{cells[max_day+3]}'.strip()
+        librarians[n]['prefered_length'] = cells[max_day+4]
+        # Extract extended work hours; skip comment columns
+        for d, x in enumerate(cells[1:1+max_day]):
+            if not is_time_cell(x):
+                continue
+            try:
+                intervals = parse_time_ranges(x)
+            except ValueError as e:
+                report(name, weekdays[d], x, f'{e}')
+                continue
+            for start, end in intervals:
+                slots = available_slots(shift_starts, last_end, start, end)
+                if slots is not None:
+                    availability[n, d, slots[0]:slots[1] + 1, :] = 1
     log_message(log_output, '')
+    return availability, librarians
+
 
-    sheet = wb_obj['règles']
+def parse_rules(rows, parsed, report, log_output):
+    """
+    Selected rules, and the weights of the soft ones (optional third column): a soft rule
+    can be violated, at the cost of its weight in the objective, instead of making the schedule impossible
+    """
     rules = {}
-    for row in sheet.iter_rows():
-        if len(row) > 0:
-            if row[0] is not None:
-                cells = [cell.value for cell in row]
-                if cells[0] is not None:
-                    name = cells[0]
-                    try:
-                        value = int(cells[1])
-                    except ValueError:
-                        value = 0
-                    rules[name] = (value > 0)
-    
-    return availability, librarians, locations, quota, meeting_slots, rules, weekdays, shifts
+    rule_weights = {}
+    for cells in rows:
+        cells = padded(cells, 3)
+        name = cells[0]
+        try:
+            value = int(cells[1])
+        except (TypeError, ValueError):
+            value = 0
+        rules[name] = (value > 0)
+        if cells[2] is None:
+            continue
+        try:
+            weight = int(cells[2])
+        except (TypeError, ValueError):
+            report(name, 'C', cells[2], 'invalid weight, hard rule')
+            continue
+        if name not in constraint_names:
+            report(name, 'C', cells[2], 'not a constraint, weight ignored')
+        elif weight > 0:
+            rule_weights[name] = weight
+    if len(rule_weights) > 0:
+        log_message(log_output, f'Soft rules: {rule_weights}')
+    return rules, rule_weights
+
+
+def parse_solver_settings(rows, parsed, report, log_output):
+    """
+    Optional solver performance settings (older workbooks have no such sheet)
+    """
+    solver_settings = {}
+    for cells in rows:
+        if len(cells) > 1 and cells[1] is not None:
+            name = f'{cells[0]}'.strip()
+            if name not in solver_parameters:
+                report(name, 'A', name, 'unknown solver setting, ignored')
+                continue
+            try:
+                solver_settings[name] = solver_parameters[name][1](cells[1])
+            except ValueError:
+                report(name, 'B', cells[1], 'invalid value, ignored')
+    log_message(log_output, f'Solver settings: {solver_settings}')
+    return solver_settings
+
+
+# Sheet name -> (sheets its parsing depends on, parser), in parsing order
+sheet_parsers = {
+    'jours': ([], parse_days),
+    'shifts': ([], parse_shifts),
+    'guichets': (['jours', 'shifts'], parse_locations),
+    'quotas': ([], parse_quotas),
+    'séances': (['shifts'], parse_meetings),
+    'guichetiers': (['jours', 'shifts', 'guichets'], parse_librarians),
+    'règles': ([], parse_rules),
+    'solveur': ([], parse_solver_settings),
+}
+
+# Sheets that may be missing from older workbooks
+optional_sheets = ['solveur']
+
+# Increase whenever a parser changes its results, so that cached inputs are parsed again (see input_cache.py)
+parser_version = 4
+
+
+def log_malformed(error_output, malformed):
+    """
+    All the cells that could not be read, in one block of the error log
+    """
+    lines = []
+    for name, cells in malformed.items():
+        for row, column, value, reason in cells:
+            lines.append(f"  {name} / {row} / {column}: {value!r} ({reason})")
+    if len(lines) > 0:
+        log_error_message(error_output, f'{len(lines)} cells could not be read:\n' + '\n'.join(lines))
+
+
+def parse_tables(tables, log_output, error_output, parsed=None, malformed=None):
+    """
+    Run the parsers of the sheets missing from parsed (all of them by default), in order.
+    The cells that could not be read are collected per sheet in malformed and logged together.
+    """
+    if parsed is None:
+        parsed = {}
+    if malformed is None:
+        malformed = {}
+    for name, (dependencies, parser) in sheet_parsers.items():
+        if name in parsed:
+            continue
+        if name not in tables and name in optional_sheets:
+            rows = []
+        else:
+            rows = tables[name]
+        malformed[name] = []
+        report = lambda row, column, value, reason, cells=malformed[name]: cells.append((row, f'{column}', f'{value}', reason))
+        parsed[name] = parser(rows, parsed, report, log_output)
+    log_malformed(error_output, malformed)
+    return parsed
+
+
+def work_schedules(parsed):
+    """
+    Results of parse_tables in the order returned by read_work_schedules
+    """
+    availability, librarians = parsed['guichetiers']
+    rules, rule_weights = parsed['règles']
+    return (availability, librarians, parsed['guichets'], parsed['quotas'], parsed['séances'], rules,
+            parsed['jours'], parsed['shifts'], parsed['solveur'], rule_weights)
+
+
+def read_workbook_tables(xlsx_filename, log_output):
+    wb_obj = openpyxl.load_workbook(xlsx_filename, read_only=True, data_only=True)
+    try:
+        return read_tables(wb_obj, log_output)
+    finally:
+        wb_obj.close()
+
+
+def read_work_schedules(xlsx_filename, log_output, error_output):
+    log_message(log_output, 'Input file: ' + xlsx_filename)
+    tables = read_workbook_tables(xlsx_filename, log_output)
+    return work_schedules(parse_tables(tables, log_output, error_output))
 
 
 def check_minima(log_output, error_output, availabilities, librarians, locations, quota, meeting_slots, rules, weekdays, shifts):
     """
-    Perform some minimal checks: are there slots where we just don't have any available people to begwin with?
+    Perform some minimal checks: are there slots where we just don't have any available people to begin with?
+    Returns the warnings and the shortfall[d, s] matrix: open locations minus available librarians, if positive
     """
-    max_shift = len(shifts)
-    max_location = len(locations)
     max_day = len(weekdays)
-    test_roster = numpy.zeros(shape=(max_day, max_shift, max_location), dtype=numpy.int8)
-    minimal_roster = numpy.zeros(shape=(max_day, max_shift, max_location), dtype=numpy.int8)
+    max_shift = len(shifts)
+    available = numpy.asarray(availabilities, dtype=bool).any(axis=3).sum(axis=0)
+    required = location_open_slots(locations, max_day, max_shift).sum(axis=2)
+    shortfall = numpy.maximum(required - available, 0)
 
     msg = ''
-    for d in range(max_day):
-        for s in range(max_shift):
-            for l in range(max_location):
-                for n in range(len(librarians)):
-                    test_roster[d][s][l] += availabilities[n][d][s][l]
-            frameinfo = getframeinfo(currentframe())
-            log_message(log_output, f'({frameinfo.filename}:{frameinfo.lineno + 1}) d {d} ({weekdays[d]}) s {s} l {l}: roster = {test_roster[d][s][l]}')
-            if test_roster[d][s][0] < sum([shifts[s][0] - shifts[s][0]  >= locations[l]['times'][d]['start'] \
-                and shifts[-1][0] - shifts[s][0] <= locations[l]['times'][d]['start'] for l in range(max_location)]):
-                    hh = '{:0>2}'.format(shifts[s][0]//60)
-                    mm = '{:0>2}'.format(shifts[s][0]%60)
-                    msg += f'Warning: not enough staff to fill the {weekdays[d]} {hh}h{mm} slot<br/>\n'
-
-    for d in range(max_day):
-        log_message(log_output, weekdays[d])
-        for s in range(max_shift):
-            frameinfo = getframeinfo(currentframe())
-            log_message(log_output, f'({frameinfo.filename}:{frameinfo.lineno + 1}) {[test_roster[d][s][0] for l in range(max_location)]}')
-    frameinfo = getframeinfo(currentframe())
-    log_message(log_output, f'({frameinfo.filename}:{frameinfo.lineno + 1}) msg "{msg}"')
-
-    return msg
+    for d in numpy.flatnonzero(shortfall.any(axis=1)):
+        slots = [f'{shifts[s][0] // 60:0>2}h{shifts[s][0] % 60:0>2} ({shortfall[d, s]})' for s in numpy.flatnonzero(shortfall[d])]
+        msg += f"Warning: not enough staff to fill the {weekdays[d]} {', '.join(slots)} slot(s)<br/>\n"
+    if debug_enabled():
+        log_debug(log_output, f'Available librarians per day and shift:\n{available}')
+        log_debug(log_output, f'Open locations per day and shift:\n{required}')
+    # A gap in the coverage is a property of the data, not an error of the run: log and report only
+    if shortfall.any():
+        log_message(log_output, f'{numpy.count_nonzero(shortfall)} day/shift slot(s) cannot be fully staffed, '
+                                f'{shortfall.sum()} librarian(s) missing in total: the schedule will have holes '
+                                f'or be infeasible, see the coverage table of the report', WARNING)
+    log_message(log_output, f'msg "{msg}"')
+
+    return msg, shortfall
+
+
+def shortfall_html(shortfall, weekdays, shifts):
+    """
+    Heatmap of check_minima's shortfall, one row per day and one column per shift
+    """
+    worst = max(int(shortfall.max(initial=0)), 1)
+    html = '<div><table id="coverage" class="table">\n<thead><tr><th scope="col">Day</th>'
+    for start, length in shifts:
+        html += f'<th scope="col">{start // 60:0>2}:{start % 60:0>2}</th>'
+    html += '</tr></thead>\n<tbody>'
+    for d in range(len(weekdays)):
+        html += f'<tr><td>{weekdays[d]}</td>'
+        for s in range(len(shifts)):
+            missing = int(shortfall[d, s])
+            if missing > 0:
+                html += f'<td style="background-color: rgba(220, 53, 69, {0.2 + 0.8 * missing / worst:.2f})">{missing}</td>'
+            else:
+                html += '<td></td>'
+        html += '</tr>\n'
+    html += '</tbody></table></div>\n'
+    return html
 
 
 if __name__ == '__main__':
+    # Parse a workbook ahead of time: the next run of or_librarydesk_schedule.py reads it from the cache
+    from input_cache import read_cached_work_schedules
     if len(sys.argv) < 2:
-        log_message(log_output, f'Syntaxe: {sys.argv[0]} <XLSX filename>')
-        log_message(log_output, 'Le fichier XLSX doit contenir les horaires étendus des collaborateurs')
+        print(f'Syntaxe: {sys.argv[0]} <XLSX filename>')
+        print('Le fichier XLSX doit contenir les horaires étendus des collaborateurs')
         exit(1)
     else:
-        availabilities, librarians, locations, quota, meeting_slots, rules, weekdays, shifts = read_work_schedules(sys.argv[1])
-        msg = check_minima(availabilities, librarians, locations, quota, meeting_slots, rules, weekdays, shifts)
-        outfile = open('work_schedule.py', 'w')
-        outfile.write('from numpy import array, int8\n\n')
-        outfile.write(f'librarians = {str(librarians)}\n')
-        outfile.write(f'shift_requests = {str(availabilities)}\n')
-        outfile.write(f'\nmeeting_slots = {str(meeting_slots)}\n')
-        outfile.write(f'\nlocations = {str(locations)}\n')
-        outfile.write(f'\nquota = {str(quota)}\n')
-        outfile.write(f'\nrules = {str(rules)}\n')
-        outfile.write(f'\nweekdays = {str(weekdays)}\n')
-        outfile.write(f'\ndesk_shifts = {str(shifts)}\n')
-        msg = msg.replace("\n", "\\n")
-        outfile.write(f'\nmsg = "{msg}"\n')
+        log_output = sys.argv[1].replace('.xlsx', '') + '_log.txt'
+        error_output = sys.argv[1].replace('.xlsx', '') + '_errors.txt'
+        availabilities, librarians, locations, quota, meeting_slots, rules, weekdays, shifts, solver_settings, rule_weights = read_cached_work_schedules(sys.argv[1], log_output, error_output)
+        msg, shortfall = check_minima(log_output, error_output, availabilities, librarians, locations, quota, meeting_slots, rules, weekdays, shifts)
+        print(f'{len(librarians)} librarians, {len(weekdays)} days, {len(shifts)} shifts, {len(locations)} locations')
+        print(msg.replace('<br/>', ''))
@@ -0,0 +1,356 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import os
+from bisect import bisect_right
+from string import Template
+
+import numpy
+
+from errors import log_message, log_debug, debug_enabled
+from desk_model import index_groups
+from desk_calendar import calendar_weeks
+from read_work_schedule import shortfall_html
+from run_metrics import metrics_html
+
+
+"""
+HTML report of a schedule, written row by row to the output file. Horizons of
+more than one calendar week get an index page (<workbook>.html: diagnostics,
+statistics, librarian summary) and one page per week
+(<workbook>_week<k>.html: schedule tables and daily details).
+"""
+
+main_title = "Proposed desk schedule"
+
+page_header = Template("""<!DOCTYPE html>
+<html>
+<head><title>$title</title>
+<script type="text/javascript"
+              src="https://cdnjs.cloudflare.com/ajax/libs/jquery/3.7.0/jquery.min.js"
+              crossorigin="anonymous"></script>
+<script type="text/javascript" src="https://cdn.datatables.net/1.13.4/js/jquery.dataTables.min.js"></script>
+<script src="https://cdnjs.cloudflare.com/ajax/libs/mark.js/8.11.1/mark.min.js" integrity="sha512-5CYOlHXGh6QpOFA/TeTylKLWfB3ftPsde7AnmhuitiTX4K5SqCLBeKro6sPS8ilsz1Q4NRx3v8Ko2IBiszzdww==" crossorigin="anonymous" referrerpolicy="no-referrer"></script>
+<script src="https://cdnjs.cloudflare.com/ajax/libs/mark.js/8.11.1/jquery.mark.es6.js" integrity="sha512-4PUcRoBmsfaiXPoigt+rm4mfuXpvvwfC7dFIhHkwVQGECJzaFDMR8HGTxNDLkwC4DlJq3/EYHL77YXFr34Jmog==" crossorigin="anonymous" referrerpolicy="no-referrer"></script>
+<script src=" https://cdn.jsdelivr.net/npm/datatables.mark.js@2.1.0/dist/datatables.mark.min.js "></script>
+
+<style>
+
+body {
+    font-family: Arial, Helvetica, sans-serif;
+}
+
+#schedule, #guichetbiblio {
+  border collapse: collapse;
+  width: 100%;
+}
+
+#schedule td, #schedule th {
+  border: 1px solid #ddd;
+  padding: 8px;
+}
+
+#guichetbiblio td, #guichetbiblio th {
+  border: 1px solid #ddd;
+  padding: 8px;
+}
+
+#schedule tr:nth-child(even){background-color: #f2f2f2;}
+#guichetbiblio tr:nth-child(even){background-color: #f2f2f2;}
+
+#schedule tr:hover {background-color: #ddd;}
+#guichetbiblio tr:hover {background-color: #ddd;}
+
+#schedule th {
+  padding-top: 12px;
+  padding-bottom: 12px;
+  text-align: left;
+  background-color: #04AA6D;
+  color: white;
+}
+
+#guichetbiblio th {
+  padding-top: 12px;
+  padding-bottom: 12px;
+  text-align: left;
+  background-color: #0000FF;
+  color: white;
+}
+</style></head>
+<body>
+<h1>$heading</h1>
+""")
+
+datatables_init = """
+    <script>
+    $(document).ready(function() {
+        $('#schedule').DataTable({
+            "paging": false,
+            "mark": true
+        });
+        $('#guichetbiblio').DataTable({
+            "paging": false,
+            "mark": true,
+            "ordering": false
+        });
+    });
+  </script>
+"""
+
+page_footer = "</body></html>"
+
+
+def shift_label(shift):
+    start, length = shift
+    return f'{start // 60:0>2}:{start % 60:0>2}-{(start + length) // 60:0>2}:{(start + length) % 60:0>2}'
+
+
+def schedule_statistics(report):
+    """
+    Everything the report shows about the assignment, from reductions of the assignment array
+    """
+    librarians = report['librarians']
+    desk_shifts = report['desk_shifts']
+    assignment = numpy.asarray(report['assignment'], dtype=numpy.int64)
+    requests = numpy.asarray(report['shift_requests'])
+    groups = index_groups(librarians, report['locations'], report['quota'], report['meeting_slots'],
+                          report['calendar'], desk_shifts)
+    num_librarians = assignment.shape[0]
+    minutes = groups['shift_minutes']
+    shift_starts = [x[0] for x in desk_shifts]
+    pm_slot = bisect_right(shift_starts, 12 * 60)
+
+    stats = {}
+    # Librarian shown in each cell of the tables: the last one assigned, -1 if none
+    assigned = assignment.any(axis=0)
+    stats['who'] = numpy.where(assigned, num_librarians - 1 - assignment[::-1].argmax(axis=0), -1)
+    # Assigned cells in (d, lo, s, n) order, and whether they respect work hours and meetings
+    cells = numpy.argwhere(assignment.transpose(1, 3, 2, 0))
+    d, lo, s, n = cells.T
+    stats['cells'] = cells
+    stats['requested'] = requests[n, d, s, lo] == 1
+    stats['in_meeting'] = groups['meetings'][n, d, s]
+    # minutes[n, d, s] worked at any location
+    worked = assignment.sum(axis=3) * minutes[numpy.newaxis, numpy.newaxis, :]
+    stats['daily_minutes'] = worked.sum(axis=2)
+    stats['am_minutes'] = worked[:, :, :pm_slot].sum(axis=2)
+    stats['pm_minutes'] = worked[:, :, pm_slot:-1].sum(axis=2)
+    stats['sectors'] = groups['sectors']
+    location_minutes = (assignment * minutes[numpy.newaxis, numpy.newaxis, :, numpy.newaxis]).sum(axis=(1, 2))
+    stats['active_hours'] = location_minutes[:, groups['active_locations']].sum(axis=1) / 60
+    stats['reserve_hours'] = location_minutes[:, groups['reserve_locations']].sum(axis=1) / 60
+    stats['days_on_duty'] = (assignment.sum(axis=(2, 3)) > 0).sum(axis=1)
+    return stats
+
+
+def write_guichetbiblio_table(out, days, report, stats):
+    locations = report['locations']
+    desk_shifts = report['desk_shifts']
+    names = [report['librarians'][n]['name'] for n in range(len(report['librarians']))] + ['N/A']
+    who = stats['who']
+    out.write('\n<h2>Summary table (for guichetbiblio.epfl.ch)</h2>\n')
+    out.write('<div><table id="guichetbiblio" class="table">\n<thead><tr>\n<th scope="col">Poste</th>')
+    for shift in desk_shifts:
+        out.write(f'<th scope="col">{shift_label(shift)}</th>')
+    out.write('\n</tr>\n</thead>\n<tbody>')
+    empty_row = '<tr><td></td>' + '<td></td>' * len(desk_shifts) + '</tr>\n'
+    for d in days:
+        for lo in range(len(locations)):
+            cells = ''.join([f'<td>{names[n]}</td>' for n in who[d, :, lo]])
+            out.write(f"<tr>\n<td>{report['weekdays'][d]} {locations[lo]['name']}</td>{cells}</tr>\n")
+        # Empty row for better readability
+        out.write(empty_row)
+    out.write('</tbody></table></div>')
+
+
+def write_schedule_table(out, days, report, stats):
+    locations = report['locations']
+    desk_shifts = report['desk_shifts']
+    names = [report['librarians'][n]['name'] for n in range(len(report['librarians']))] + ['N/A']
+    who = stats['who']
+    out.write('\n<h2>Summary table (for other use cases)</h2>\n')
+    out.write('<div><table id="schedule" class="table">\n<thead><tr>\n<th scope="col">Time</th>')
+    for d in days:
+        out.write(f"<th scope=\"col\">{report['weekdays'][d]}</th>")
+    out.write('\n</tr>\n</thead>\n<tbody>')
+    for s in range(len(desk_shifts)):
+        for lo in range(len(locations)):
+            cells = ''.join([f'<td>{names[who[d, s, lo]]}</td>' for d in days])
+            out.write(f"<tr>\n<td>{shift_label(desk_shifts[s])} {locations[lo]['name']}</td>{cells}\n</tr>\n")
+    out.write('</tbody></table></div>')
+
+
+def write_day_details(out, days, report, stats):
+    """
+    Assignments of each day, checked against work hours and group meetings, and sector statistics
+    """
+    librarians = report['librarians']
+    locations = report['locations']
+    desk_shifts = report['desk_shifts']
+    meeting_slots = report['meeting_slots']
+    weekdays = report['weekdays']
+    sector_quotas = report['sector_quotas']
+    log_output = report['log_output']
+    cells = stats['cells']
+    # cells are sorted by day
+    first_cells = numpy.searchsorted(cells[:, 0], list(days), side='left')
+    last_cells = numpy.searchsorted(cells[:, 0], list(days), side='right')
+
+    out.write('\n<div>')
+    for k, d in enumerate(days):
+        line = f'Day {d}'
+        log_debug(log_output, line)
+        out.write('<br/>\n' + line + '<br/>\n')
+        for c in range(first_cells[k], last_cells[k]):
+            d, lo, s, n = cells[c].tolist()
+            hh = desk_shifts[s][0] // 60
+            mm = '{:0>2}'.format(desk_shifts[s][0] % 60)
+            length = desk_shifts[s][1] / 60
+            line = f'{librarians[n]["name"]} works {length}h at {hh}:{mm} on {weekdays[d]} at {locations[lo]["name"]}'
+            if not stats['requested'][c]:
+                line += ' (problem with work hours).'
+                log_message(log_output, line)
+            elif stats['in_meeting'][c]:
+                line += ' (problem with a group meeting).'
+                log_message(log_output, f"{line} {d} {s} {meeting_slots[librarians[n]['sector']]}")
+            else:
+                line += ' (OK with work hours).'
+                log_message(log_output, line)
+            out.write(line + '<br/>\n')
+
+        for sector in sector_quotas:
+            members = stats['sectors'].get(sector, [])
+            # A sector without librarians reads 0, not 0.0, as it always did
+            score = stats['daily_minutes'][members, d].sum() / 60 if len(members) > 0 else 0
+            unique_librarians = numpy.count_nonzero(stats['daily_minutes'][members, d])
+            am_librarians = numpy.count_nonzero(stats['am_minutes'][members, d])
+            pm_librarians = numpy.count_nonzero(stats['pm_minutes'][members, d])
+            line = f'Daily shifts for {sector.upper()}: {score} (using {unique_librarians} unique librarian(s), minimum {sector_quotas[sector]})'
+            log_message(log_output, line)
+            out.write(line + '<br/>\n')
+            line = f'Morning (8h-12h): {am_librarians} librarian(s), afternoon (after 12h-20h): {pm_librarians} librarian(s)'
+            log_message(log_output, line)
+            out.write(line + '<br/>\n')
+    log_message(log_output, '')
+    out.write('</div>')
+
+
+def write_librarian_summary(out, report, stats):
+    librarians = report['librarians']
+    quota = report['quota']
+    log_output = report['log_output']
+
+    line = 'Librarians work summary'
+    log_message(log_output, line)
+    out.write('\n<div><br/>\n' + line + '<br/>\n')
+    for n in range(len(librarians)):
+        s1 = f'{librarians[n]["name"]} is working {stats["active_hours"][n]}/{quota[librarians[n]["type"]][0]}'
+        s2 = f' and acting as a reserve for {stats["reserve_hours"][n]}/{quota[librarians[n]["type"]][1]} hours'
+        s3 = f', with {stats["days_on_duty"][n]} days on duty'
+        line = s1 + s2 + s3
+        if report['absence_days'][n] > 0:
+            line += f' ({report["absence_days"][n]} day(s) on leave)'
+        log_message(log_output, line)
+        out.write(line + '<br/>\n')
+
+        # Full availability and assignment dumps, only with --debug
+        if debug_enabled():
+            log_debug(log_output, librarians[n]['name'])
+            for d in range(len(report['weekdays'])):
+                log_debug(log_output, report['weekdays'][d])
+                log_debug(log_output, 'availability:')
+                log_debug(log_output, str(report['shift_requests'][n][d]))
+                log_debug(log_output, 'assigned:')
+                for s in range(len(report['desk_shifts'])):
+                    log_debug(log_output, str(report['assignment'][n, d, s].tolist()))
+    out.write('</div>')
+
+
+def write_violated_rules(out, report):
+    """
+    Soft rules given up, per librarian and per day and shift
+    """
+    violated = report['violated_rules']
+    if len(violated) == 0:
+        return
+    log_output = report['log_output']
+    per_librarian = {}
+    per_slot = {}
+    for rule, scope, cost in violated:
+        if 'librarian' in scope:
+            when = f" on {report['weekdays'][scope['day']]}" if 'day' in scope else ''
+            per_librarian.setdefault(scope['librarian'], []).append(f'{rule}{when} (penalty {cost})')
+        else:
+            where = f" at {report['locations'][scope['location']]['name']}" if 'location' in scope else ''
+            per_slot.setdefault((scope['day'], scope['shift']), []).append(f'{rule}{where} (penalty {cost})')
+    line = 'Soft rules violated'
+    log_message(log_output, line)
+    out.write('\n<h2>' + line + '</h2>\n<div>\n')
+    for n in sorted(per_librarian):
+        line = f"{report['librarians'][n]['name']}: {', '.join(per_librarian[n])}"
+        log_message(log_output, line)
+        out.write(line + '<br/>\n')
+    for d, s in sorted(per_slot):
+        line = f"{report['weekdays'][d]} {shift_label(report['desk_shifts'][s])}: {', '.join(per_slot[(d, s)])}"
+        log_message(log_output, line)
+        out.write(line + '<br/>\n')
+    out.write('</div>')
+
+
+def write_summary(out, report):
+    out.write(f"<h2>Diagnostics:</h2>\n<pre><code>{report['diagnostics']}</code></pre>")
+    out.write('\n<h2>Coverage: librarians missing per day and shift</h2>\n')
+    out.write(shortfall_html(report['shortfall'], report['weekdays'], report['desk_shifts']))
+    out.write('<h2>Technical statistics:</h2>')
+    out.write(f"<div>{report['score']}</div>\n<pre><code>{report['stat_details']}</code></pre>")
+
+
+def write_performance(out, report):
+    # The phases completed so far: the phases are opened and closed by main() only
+    out.write(f"\n<h2>Performance</h2>\n{metrics_html(report['metrics'])}")
+
+
+def week_filename(html_filename, k):
+    return html_filename.replace('.html', '') + f'_week{k + 1}.html'
+
+
+def write_report(html_filename, report):
+    """
+    Write the report; returns the names of the files written, the index page first
+    """
+    weekdays = report['weekdays']
+    weeks = calendar_weeks(report['calendar'])
+    filenames = [html_filename]
+    stats = schedule_statistics(report)
+    with open(html_filename, 'w') as out:
+        out.write(page_header.substitute(title=main_title, heading=main_title))
+        out.write(datatables_init)
+        write_summary(out, report)
+        if len(weeks) > 1:
+            out.write('\n<h2>Weeks</h2>\n<ul>\n')
+            for k, days in enumerate(weeks):
+                link = os.path.basename(week_filename(html_filename, k))
+                out.write(f'<li><a href="{link}">Week {k + 1}: {weekdays[days[0]]} - {weekdays[days[-1]]}</a></li>\n')
+            out.write('</ul>\n')
+            for k, days in enumerate(weeks):
+                filename = week_filename(html_filename, k)
+                filenames.append(filename)
+                with open(filename, 'w') as week_out:
+                    title = f'{main_title}, week {k + 1}'
+                    week_out.write(page_header.substitute(title=title, heading=title))
+                    week_out.write(datatables_init)
+                    week_out.write(f'<div><a href="{os.path.basename(html_filename)}">Index</a></div>\n')
+                    write_guichetbiblio_table(week_out, days, report, stats)
+                    write_schedule_table(week_out, days, report, stats)
+                    write_day_details(week_out, days, report, stats)
+                    week_out.write(page_footer)
+        else:
+            days = range(len(weekdays))
+            write_guichetbiblio_table(out, days, report, stats)
+            write_schedule_table(out, days, report, stats)
+            write_day_details(out, days, report, stats)
+        write_librarian_summary(out, report, stats)
+        write_violated_rules(out, report)
+        write_performance(out, report)
+        out.write(page_footer)
+    return filenames
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+from concurrent.futures import ProcessPoolExecutor
+from ortools.sat.python import cp_model
+import numpy
+import time
+
+from errors import log_message, log_error_message, flush_logs
+from desk_model import build_model, apply_solver_settings, solution_array, index_groups, violated_rules, objective_bound
+from desk_model import minimum_targets
+from desk_calendar import calendar_weeks
+from run_metrics import record_rule_time, record_model_size
+from infeasibility import explain_infeasibility
+from run_control import SolutionProgress, check_cancelled, set_solver
+
+
+"""
+Rolling-horizon decomposition for long (vacation) periods: instead of one
+model over the whole horizon, one model per calendar week is solved. The quota
+budget of each week is what remains of the horizon's quotas, pro rata of the
+days planned so far, after the hours actually assigned in the previous weeks.
+The minimum hours of the horizon (minActiveShifts, minReserveShifts,
+holidaySpecialQuota) are split the same way, so that the weekly targets add up
+to the horizon's target instead of repeating its tolerance or scale every week.
+"""
+
+# Hours used by the previous weeks towards each minimum target
+target_usage = {'min_active': 'quota_active', 'min_reserve': 'quota_reserve', 'min_holiday': 'quota_active'}
+
+
+class WeekNotSolved(Exception):
+    """
+    At least one week has no solution (infeasible, or none found in time)
+    """
+
+
+def period_subset(days, locations, calendar, weekdays):
+    """
+    Locations, calendar and weekdays restricted to the given days, renumbered from 0
+    """
+    sub_locations = {}
+    for lo in locations:
+        sub_locations[lo] = {'name': locations[lo]['name'],
+                             'times': {k: locations[lo]['times'][d] for k, d in enumerate(days)}}
+    sub_calendar = {k: calendar[d] for k, d in enumerate(days)}
+    sub_weekdays = {k: weekdays[d] for k, d in enumerate(days)}
+    return sub_locations, sub_calendar, sub_weekdays
+
+
+def quota_usage(assignment, groups):
+    """
+    Active hours, reserve hours and days on duty of each librarian in an assignment
+    """
+    hours = groups['shift_hours'][numpy.newaxis, numpy.newaxis, :, numpy.newaxis]
+    worked = assignment * hours
+    return {
+        'quota_active': worked[:, :, :, groups['active_locations']].sum(axis=(1, 2, 3)),
+        'quota_reserve': worked[:, :, :, groups['reserve_locations']].sum(axis=(1, 2, 3)),
+        'quota_days': (assignment.sum(axis=(2, 3)) > 0).sum(axis=1),
+    }
+
+
+def solve_period(period, run_control=None):
+    """
+    Build and solve the model of one week; runs in a worker process when weeks are independent.
+    run_control (see run_control.py) only in the process of the run: it cannot be sent to the workers.
+    """
+    period_metrics = {'rules': {}, 'model': {}}
+    start = time.perf_counter()
+    desk = build_model(period['shift_requests'], period['librarians'], period['locations'], period['quota'],
+                       period['meeting_slots'], period['rules'], period['calendar'], period['desk_shifts'], 1,
+                       period['log_output'], quotas=period['quotas'], last_shift_closed=period['last_shift_closed'],
+                       metrics=period_metrics, rule_weights=period['rule_weights'])
+    record_model_size(period_metrics, desk['model'])
+    build_seconds = time.perf_counter() - start
+    solver = cp_model.CpSolver()
+    apply_solver_settings(solver, period['solver_settings'])
+    target = objective_bound(period['locations'], len(period['calendar'].keys()), len(period['desk_shifts']),
+                             period['rules'], period['last_shift_closed'])
+    solution_progress = SolutionProgress(run_control, period['log_output'], target, period['solver_settings'].get('relativeGap'),
+                                         period['solver_settings'].get('absoluteGap'))
+    set_solver(run_control, solver)
+    try:
+        status = solver.Solve(desk['model'], solution_progress)
+    finally:
+        set_solver(run_control, None)
+    if solution_progress.stop_reason is not None:
+        log_message(period['log_output'], f'Search stopped after {solution_progress.solution_count} schedule(s): {solution_progress.stop_reason}')
+    if solution_progress.target_reached:
+        status = cp_model.OPTIMAL
+    result = {
+        'metrics': period_metrics,
+        'build_seconds': round(build_seconds, 4),
+        'solve_seconds': round(solver.WallTime(), 4),
+        'status': solver.StatusName(status),
+        'stats': f'{solver.ResponseStats()}',
+        'n_conditions': desk['n_conditions'],
+        'assignment': None,
+        'objective': None,
+        'explanation': [],
+        'violated': [],
+    }
+    if status == cp_model.INFEASIBLE:
+        result['explanation'] = explain_infeasibility(desk, solver, period['solver_settings'], period['weekdays'], period['log_output'])
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        result['assignment'] = solution_array(solver, desk['shifts'], desk['indices'])
+        result['objective'] = int(round(solver.ObjectiveValue()))
+        result['violated'] = violated_rules(desk, solver)
+    # Worker processes exit without running atexit handlers
+    flush_logs()
+    return result
+
+
+def solve_weekly(shift_requests, librarians, locations, quota, meeting_slots, rules, calendar, weekdays,
+                 desk_shifts, solver_settings, log_output, error_output, workers=1, metrics=None, rule_weights=None,
+                 scale=1, run_control=None):
+    """
+    Solve the horizon week by week.
+    With workers == 1, each week's quota budget is carried forward from the previous weeks' results;
+    with more workers, the weeks are solved independently in a process pool, each with its pro rata share.
+    Returns the assignment of the whole horizon, the worst status, the solver statistics, the number of conditions
+    and the soft rules violated.
+    A cancelled run (run_control) raises RunCancelled before the next week: the horizon is not complete.
+    With workers > 1, cancelling only stops the run before the pool is started.
+    """
+    requests = numpy.asarray(shift_requests, dtype=numpy.int8)
+    num_days = len(calendar.keys())
+    weeks = calendar_weeks(calendar)
+    groups = index_groups(librarians, locations, quota, meeting_slots, calendar, desk_shifts)
+    horizon_quotas = {k: groups[k].astype(numpy.float64) for k in ('quota_active', 'quota_reserve', 'quota_days')}
+    horizon_targets = {k: numpy.maximum(v, 0) for k, v in minimum_targets(groups, scale).items()}
+    used = {k: numpy.zeros(shape=len(librarians.keys()), dtype=numpy.int64) for k in horizon_quotas}
+
+    def cumulative_target(k, planned_days):
+        # Share of a minimum target due by the end of the planned days, the whole target at the end
+        return (horizon_targets[k] * planned_days) // num_days
+
+    def new_period(k, days, quotas):
+        sub_locations, sub_calendar, sub_weekdays = period_subset(days, locations, calendar, weekdays)
+        return {
+            'shift_requests': requests[:, days], 'librarians': librarians, 'locations': sub_locations,
+            'quota': quota, 'meeting_slots': meeting_slots, 'rules': rules, 'calendar': sub_calendar,
+            'weekdays': sub_weekdays, 'desk_shifts': desk_shifts, 'solver_settings': solver_settings, 'log_output': log_output,
+            'quotas': quotas, 'last_shift_closed': k == len(weeks) - 1, 'rule_weights': rule_weights,
+        }
+
+    results = []
+    if workers > 1:
+        periods = []
+        planned_days = 0
+        for k, days in enumerate(weeks):
+            share = len(days) / num_days
+            quotas = {q: numpy.ceil(horizon_quotas[q] * share).astype(numpy.int64) for q in horizon_quotas}
+            # Differences of the cumulative targets: the weeks add up to the horizon's target
+            for t in horizon_targets:
+                quotas[t] = cumulative_target(t, planned_days + len(days)) - cumulative_target(t, planned_days)
+            planned_days += len(days)
+            periods.append(new_period(k, days, quotas))
+        log_message(log_output, f'Solving {len(weeks)} independent weeks with {workers} worker processes')
+        # The workers must not inherit, and write again, what is still buffered
+        flush_logs()
+        check_cancelled(run_control)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(solve_period, periods))
+    else:
+        planned_days = 0
+        for k, days in enumerate(weeks):
+            planned_days += len(days)
+            # Budget = pro rata target up to the end of this week - what the previous weeks actually used
+            quotas = {}
+            for q in horizon_quotas:
+                target = numpy.ceil(horizon_quotas[q] * planned_days / num_days).astype(numpy.int64)
+                quotas[q] = numpy.maximum(target - used[q], 0)
+            # Minimum hours still due by the end of this week after what the previous weeks assigned
+            for t in horizon_targets:
+                quotas[t] = numpy.maximum(cumulative_target(t, planned_days) - used[target_usage[t]], 0)
+            check_cancelled(run_control)
+            result = solve_period(new_period(k, days, quotas), run_control)
+            results.append(result)
+            if result['assignment'] is None:
+                break
+            week_usage = quota_usage(result['assignment'], groups)
+            for q in used:
+                used[q] += week_usage[q]
+
+    assignment = numpy.zeros(shape=requests.shape, dtype=numpy.int8)
+    statuses = []
+    stat_details = ''
+    n_conditions = 0
+    violated = []
+    for k, result in enumerate(results):
+        days = weeks[k]
+        log_message(log_output, f"Week {k + 1} ({weekdays[days[0]]} - {weekdays[days[-1]]}): {result['status']}, objective {result['objective']}")
+        statuses.append(result['status'])
+        stat_details += f"Week {k + 1} ({weekdays[days[0]]} - {weekdays[days[-1]]}):\n{result['stats']}\n"
+        n_conditions += result['n_conditions']
+        if metrics is not None:
+            for rule, seconds in result['metrics']['rules'].items():
+                record_rule_time(metrics, rule, seconds)
+            for size, value in result['metrics']['model'].items():
+                metrics['model'][size] = metrics['model'].get(size, 0) + value
+            metrics.setdefault('weeks', []).append({'days': [f'{weekdays[d]}' for d in days], 'status': result['status'],
+                                                    'build_seconds': result['build_seconds'],
+                                                    'solve_seconds': result['solve_seconds']})
+        if result['assignment'] is None:
+            log_error_message(error_output, f"Week {k + 1} ({weekdays[days[0]]} - {weekdays[days[-1]]}) could not be solved: {result['status']}")
+            for line in result['explanation']:
+                log_error_message(error_output, line)
+        else:
+            assignment[:, days] = result['assignment']
+            # Days of the week back to days of the horizon
+            for rule, scope, weight in result['violated']:
+                if 'day' in scope:
+                    scope = dict(scope, day=days[scope['day']])
+                violated.append((rule, scope, weight))
+
+    if len(results) < len(weeks) or any(status not in ('OPTIMAL', 'FEASIBLE') for status in statuses):
+        raise(WeekNotSolved("No solution could be found"))
+    status = 'OPTIMAL' if all(status == 'OPTIMAL' for status in statuses) else 'FEASIBLE'
+    return assignment, status, stat_details, n_conditions, violated
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import threading
+
+from ortools.sat.python import cp_model
+
+from errors import log_message, debug_enabled
+
+
+"""
+Control of a run from another thread (the UI): progress messages for each
+stage and each better schedule found, and cancellation. Cancelling stops the
+solver cleanly, as a time limit would: the best schedule found so far is kept
+and reported. Before the solve, cancelling stops the run at the next stage.
+"""
+
+
+class RunCancelled(Exception):
+    """
+    The run was cancelled before a schedule was found
+    """
+
+
+def new_run_control(progress=None):
+    """
+    progress(stage, message) is called from the thread of the run
+    """
+    return {'progress': progress, 'cancel': threading.Event(), 'solver': None, 'lock': threading.Lock()}
+
+
+def report_progress(run_control, stage, message=''):
+    if run_control is not None and run_control['progress'] is not None:
+        run_control['progress'](stage, message)
+
+
+def is_cancelled(run_control):
+    return run_control is not None and run_control['cancel'].is_set()
+
+
+def check_cancelled(run_control):
+    if is_cancelled(run_control):
+        raise(RunCancelled('Run cancelled'))
+
+
+def cancel_run(run_control):
+    """
+    Called from any thread
+    """
+    run_control['cancel'].set()
+    with run_control['lock']:
+        if run_control['solver'] is not None:
+            run_control['solver'].StopSearch()
+
+
+def set_solver(run_control, solver):
+    """
+    The solver that cancel_run() must stop, None once it is done
+    """
+    if run_control is not None:
+        with run_control['lock']:
+            run_control['solver'] = solver
+
+
+def objective_gap(objective, bound):
+    """
+    Absolute and relative gap between a solution and the best bound, as defined by CP-SAT
+    """
+    absolute_gap = abs(bound - objective)
+    return absolute_gap, absolute_gap / max(1.0, abs(objective))
+
+
+class SolutionProgress(cp_model.CpSolverSolutionCallback):
+    """
+    Logs and reports each better schedule with its bound, gap and time (also
+    printed at the DEBUG log level).
+    Stops the search when the run was cancelled, when the objective reaches
+    target (a known upper bound of a maximized objective, e.g. the number of
+    open slots), or when the gap to min(solver bound, target) is within the
+    configured relative or absolute gap: the solver itself only knows its own
+    bound, often much weaker than the number of open slots.
+    """
+
+    def __init__(self, run_control=None, log_output=None, target=None, relative_gap=None, absolute_gap=None):
+        cp_model.CpSolverSolutionCallback.__init__(self)
+        self.run_control = run_control
+        self.log_output = log_output
+        self.target = target
+        self.relative_gap = relative_gap
+        self.absolute_gap = absolute_gap
+        self.solution_count = 0
+        # Why the callback stopped the search, None if it did not
+        self.stop_reason = None
+        # The objective reached target: the schedule is optimal
+        self.target_reached = False
+
+    def on_solution_callback(self):
+        objective = self.ObjectiveValue()
+        bound = self.BestObjectiveBound()
+        if self.target is not None:
+            bound = min(bound, self.target)
+        absolute_gap, relative_gap = objective_gap(objective, bound)
+        progress = f'objective {objective}, bound {bound}, gap {relative_gap:.2%}, {self.WallTime():.2f}s'
+        if debug_enabled():
+            print(f'Solution {self.solution_count}, {progress}')
+        if self.log_output is not None:
+            log_message(self.log_output, f'Solution {self.solution_count}: {progress}')
+        self.solution_count += 1
+        report_progress(self.run_control, 'objective', f'schedule {self.solution_count}: {progress}')
+        if is_cancelled(self.run_control):
+            self.stop_reason = 'cancelled'
+        elif self.target is not None and objective >= self.target:
+            self.target_reached = True
+            self.stop_reason = f'maximum score {self.target} reached'
+        elif self.relative_gap is not None and relative_gap <= self.relative_gap:
+            self.stop_reason = f'relative gap {relative_gap:.2%} within {self.relative_gap}'
+        elif self.absolute_gap is not None and absolute_gap <= self.absolute_gap:
+            self.stop_reason = f'absolute gap {absolute_gap} within {self.absolute_gap}'
+        if self.stop_reason is not None:
+            self.StopSearch()
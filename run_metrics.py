@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import json
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+
+"""
+Per-phase timing and memory of a run. The stages of main() are marked one after
+the other with start_phase(); each phase records its duration, the peak of the
+Python heap during the phase (if tracemalloc is on, see --trace-memory) and the
+peak resident memory of the process so far (CP-SAT included, not on Windows):
+the latter never decreases, a phase that needs less memory than an earlier one
+shows the peak of the earlier one.
+"""
+
+
+def new_metrics(parameter_file, trace_memory=False):
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    return {
+        'input': parameter_file,
+        'started': datetime.now().isoformat(),
+        'phases': [],
+        'rules': {},
+        'model': {},
+        'current': None,
+    }
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    if sys.platform == 'darwin':
+        return round(peak / (1 << 20), 1)
+    return round(peak / (1 << 10), 1)
+
+
+def end_phase(metrics):
+    current = metrics['current']
+    if current is None:
+        return
+    current['seconds'] = round(time.perf_counter() - current.pop('start'), 4)
+    if tracemalloc.is_tracing():
+        current['python_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / (1 << 20), 1)
+    current['process_peak_so_far_mb'] = peak_rss_mb()
+    metrics['phases'].append(current)
+    metrics['current'] = None
+
+
+def start_phase(metrics, name):
+    """
+    End the current phase, if any, and start the next one
+    """
+    if metrics is None:
+        return
+    end_phase(metrics)
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    metrics['current'] = {'name': name, 'start': time.perf_counter()}
+
+
+def record_rule_time(metrics, rule, seconds):
+    if metrics is not None:
+        metrics['rules'][rule] = round(metrics['rules'].get(rule, 0) + seconds, 4)
+
+
+def record_model_size(metrics, model):
+    if metrics is not None:
+        proto = model.Proto()
+        metrics['model']['variables'] = metrics['model'].get('variables', 0) + len(proto.variables)
+        metrics['model']['constraints'] = metrics['model'].get('constraints', 0) + len(proto.constraints)
+
+
+def metrics_filename(parameter_file):
+    return parameter_file.replace('.xlsx', '') + '_metrics.json'
+
+
+def save_metrics(filename, metrics):
+    end_phase(metrics)
+    metrics = {k: v for k, v in metrics.items() if k != 'current'}
+    metrics['total_seconds'] = round(sum(p['seconds'] for p in metrics['phases']), 4)
+    with open(filename, 'w') as fp:
+        json.dump(metrics, fp, indent=1)
+
+
+def metrics_html(metrics):
+    """
+    "Performance" section of the HTML report, for the phases completed so far
+    """
+    html = '<div><table id="performance" class="table">\n<thead><tr>'
+    html += '<th scope="col">Phase</th><th scope="col">Time (s)</th>'
+    html += '<th scope="col">Python peak (MB)</th><th scope="col">Process peak so far (MB)</th></tr></thead>\n<tbody>'
+    for p in metrics['phases']:
+        html += f"<tr><td>{p['name']}</td><td>{p['seconds']}</td>"
+        html += f"<td>{p.get('python_peak_mb', '')}</td><td>{p['process_peak_so_far_mb'] if p['process_peak_so_far_mb'] is not None else ''}</td></tr>\n"
+    html += '</tbody></table></div>\n'
+    if len(metrics['model']) > 0:
+        html += f"<div>Model size: {metrics['model'].get('variables')} variables, {metrics['model'].get('constraints')} constraints</div>\n"
+    if len(metrics['rules']) > 0:
+        rule_times = ', '.join([f'{rule} {seconds}s' for rule, seconds in metrics['rules'].items()])
+        html += f'<div>Model build time per rule: {rule_times}</div>\n'
+    return html
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import json
+from datetime import datetime
+
+import numpy
+
+from errors import log_message
+
+
+"""
+Machine-readable copy of a desk schedule, saved next to the HTML report
+(<workbook>_solution.json), so that a later run can start from it.
+"""
+
+
+def solution_filename(parameter_file):
+    return parameter_file.replace('.xlsx', '') + '_solution.json'
+
+
+def save_solution(filename, assignment, librarians, locations, calendar, desk_shifts, status=None, objective=None):
+    """
+    Save the assigned cells of assignment[n, d, s, lo] with names, dates and shift times
+    """
+    assignments = []
+    for n, d, s, lo in numpy.argwhere(assignment > 0):
+        assignments.append({
+            'librarian': librarians[n]['name'],
+            'date': calendar[d]['date'].isoformat(),
+            'day': f"{calendar[d]['label']}",
+            'weekday': int(calendar[d]['weekday']),
+            'week': int(calendar[d]['week']),
+            'start': int(desk_shifts[s][0]),
+            'length': int(desk_shifts[s][1]),
+            'location': locations[lo]['name'],
+        })
+    solution = {
+        'created': datetime.now().isoformat(),
+        'status': status,
+        'objective': objective,
+        'assignments': assignments,
+    }
+    with open(filename, 'w') as fp:
+        json.dump(solution, fp, indent=1)
+
+
+def load_solution(filename):
+    with open(filename, 'r') as fp:
+        return json.load(fp)
+
+
+def match_assignments(solution, librarians, locations, calendar, desk_shifts, by='weekday'):
+    """
+    Find the cells (n, d, s, lo) of the current period matching the assignments of a saved solution,
+    by librarian name, shift start time, location name and weekday (by='weekday') or date (by='date').
+    When matching weekdays, the weeks of the saved solution are repeated over the current period.
+    Returns the matched cells and the assignments that no longer apply.
+    """
+    previous_weeks = 1 + max([a.get('week', 0) for a in solution['assignments']], default=0)
+    librarian_index = {librarians[n]['name']: n for n in librarians}
+    location_index = {locations[lo]['name']: lo for lo in locations}
+    shift_index = {x[0]: s for s, x in enumerate(desk_shifts)}
+    day_index = {}
+    for d in calendar:
+        if by == 'date':
+            key = calendar[d]['date'].isoformat()
+        else:
+            key = (calendar[d]['weekday'], calendar[d]['week'] % previous_weeks)
+        day_index.setdefault(key, []).append(d)
+
+    matched = []
+    dropped = []
+    for assignment in solution['assignments']:
+        n = librarian_index.get(assignment['librarian'])
+        lo = location_index.get(assignment['location'])
+        s = shift_index.get(assignment['start'])
+        if by == 'date':
+            days = day_index.get(assignment['date'], [])
+        else:
+            days = day_index.get((assignment['weekday'], assignment.get('week', 0)), [])
+        if n is None or lo is None or s is None or len(days) == 0:
+            dropped.append(assignment)
+            continue
+        for d in days:
+            matched.append((n, d, s, lo))
+    return matched, dropped
+
+
+def log_dropped(log_output, dropped):
+    for assignment in dropped:
+        log_message(log_output, f"Previous assignment no longer applies: {assignment['librarian']} on {assignment['day']} "
+                                f"at {assignment['start'] // 60}:{assignment['start'] % 60:02d} ({assignment['location']})")
@@ -0,0 +1,106 @@
+import os
+import sys
+from datetime import date, timedelta
+
+import openpyxl
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate_instance import generate_instance
+from errors import flush_logs, close_logs
+
+
+"""
+Small synthetic workbooks (generate_instance) and Absences exports, written in
+the temporary directory of each test, which is also the current directory
+(main() looks for vacation.json there).
+"""
+
+# A Monday, so that 15 business days are exactly 3 calendar weeks
+first_day = date(2027, 7, 5)
+
+# Width of one day in the absence table of the exports, in pixels
+day_width = 40
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path
+    # The log handles are kept open by file name
+    close_logs()
+
+
+@pytest.fixture
+def logs(workdir):
+    """
+    Log and error files of the test, absolute paths
+    """
+    return str(workdir / 'log.txt'), str(workdir / 'errors.txt')
+
+
+def read_log(filename):
+    flush_logs()
+    with open(filename, 'r') as fp:
+        return fp.read()
+
+
+@pytest.fixture
+def workbook(workdir):
+    """
+    workbook(name, **options): path of a generated workbook, see generate_instance()
+    """
+    def make(name='desk.xlsx', **options):
+        options.setdefault('num_librarians', 20)
+        options.setdefault('num_days', 5)
+        options.setdefault('num_locations', 2)
+        options.setdefault('start_date', first_day)
+        return generate_instance(str(workdir / name), **options)
+    return make
+
+
+def edit_workbook(filename, sheet, cell, value):
+    wb = openpyxl.load_workbook(filename)
+    wb[sheet][cell] = value
+    wb.save(filename)
+
+
+def write_export(filename, people, leaves, start=first_day, num_days=10, charset=True):
+    """
+    Absences v2 planning page, same table layout as the real one:
+    leaves = [(person index, first day index, last day index, reason), ...]
+    """
+    days = [start + timedelta(days=k) for k in range(num_days)]
+    html = ['<!DOCTYPE html><html><head>']
+    if charset:
+        html.append('<meta charset="utf-8">')
+    html.append('<title>Plannings</title></head><body><div class="fc">')
+    html.append('<table class="fc-scrollgrid"><tbody><tr><td>')
+    html.append('<table class="fc-datagrid-header"><tr><th>Personne</th></tr></table>')
+    html.append(f'<table class="fc-timeline-header"><tbody><tr><th class="fc-timeline-slot" colspan="{num_days}">Mois</th></tr><tr>')
+    for day in days:
+        html.append(f'<th class="fc-day fc-timeline-slot" colspan="1" data-date="{day.isoformat()}"><div>{day.day}</div></th>')
+    html.append('</tr></tbody></table>')
+    html.append('<table class="fc-datagrid-body fc-scrollgrid-sync-table"><tbody>')
+    for name in people:
+        html.append(f'<tr><td><div class="fc-datagrid-cell-frame"><span>{name}</span></div></td></tr>')
+    html.append('</tbody></table>')
+    html.append('<div class="fc-timeline-slots"><table><tbody><tr>')
+    for day in days:
+        html.append(f'<td class="fc-day fc-timeline-slot" data-date="{day.isoformat()}"></td>')
+    html.append('</tr></tbody></table></div>')
+    width = day_width * num_days
+    html.append(f'<table class="fc-scrollgrid-sync-table" style="min-width: {width}px; width: {width}px;"><tbody>')
+    for n in range(len(people)):
+        html.append('<tr><td><div class="fc-timeline-lane"><div class="fc-timeline-events">')
+        for person, first, last, reason in leaves:
+            if person == n:
+                html.append(f'<div class="fc-timeline-event-harness" style="left: {first * day_width}px; '
+                            f'right: -{(last + 1) * day_width}px; top: 0px;"><a class="fc-event">'
+                            f'<div class="fc-event-main"><span>{reason}</span></div></a></div>')
+        html.append('</div></div></td></tr>')
+    html.append('</tbody></table></td></tr></tbody></table></div></body></html>')
+    with open(filename, 'w', encoding='utf-8') as fp:
+        fp.write(''.join(html))
+    return str(filename)
@@ -0,0 +1,49 @@
+import json
+import os
+
+import or_librarydesk_schedule
+from batch import run_batch, parse_job, run_names
+from run_metrics import metrics_filename
+
+
+rules = ['oneLibrarianPerShift', 'oneShiftAtATime', 'maxTwoShiftsPerDay', 'noOutOfTimeShift']
+
+
+def test_parse_job():
+    assert parse_job('a.xlsx') == {'workbook': os.path.abspath('a.xlsx'), 'absences': None}
+    assert parse_job('a.xlsx=juillet.html,aout.html')['absences'] == [os.path.abspath('juillet.html'),
+                                                                      os.path.abspath('aout.html')]
+    assert run_names([parse_job('x/a.xlsx'), parse_job('y/a.xlsx'), parse_job('b.xlsx')]) == ['a', 'a_2', 'b']
+
+
+def test_crash_does_not_stop_the_batch(workbook, monkeypatch):
+    solve = or_librarydesk_schedule.main
+
+    def crashing_main(parameter_file, *args, **kwargs):
+        if os.path.basename(parameter_file) == 'crash.xlsx':
+            # Like a crash of OR-Tools: the worker process dies without any summary
+            os._exit(3)
+        return solve(parameter_file, *args, **kwargs)
+
+    # The job processes are forked, and import main when they start
+    monkeypatch.setattr(or_librarydesk_schedule, 'main', crashing_main)
+    with open('broken.xlsx', 'w') as fp:
+        fp.write('not a workbook')
+    jobs = [{'workbook': workbook('good.xlsx', rules=rules), 'absences': None},
+            {'workbook': workbook('crash.xlsx', rules=rules), 'absences': None},
+            {'workbook': os.path.abspath('broken.xlsx'), 'absences': None}]
+    summaries = run_batch(jobs, 'out', workers=2)
+    assert [summary['status'] for summary in summaries] == ['OPTIMAL', 'CRASHED', 'ERROR']
+    assert summaries[1]['error'] == 'worker process exit code 3'
+    assert summaries[0]['objective'] == summaries[0]['max_score']
+
+
+def test_previous_metrics_ignored(workdir):
+    with open('broken.xlsx', 'w') as fp:
+        fp.write('not a workbook')
+    # Left by an earlier batch in the same run directory
+    os.makedirs(os.path.join('out', 'broken'))
+    with open(metrics_filename(os.path.abspath(os.path.join('out', 'broken', 'broken.xlsx'))), 'w') as fp:
+        json.dump({'status': 'OPTIMAL'}, fp)
+    summaries = run_batch([{'workbook': os.path.abspath('broken.xlsx'), 'absences': None}], 'out')
+    assert summaries[0]['status'] == 'ERROR'
@@ -0,0 +1,44 @@
+import os
+
+import numpy
+
+from conftest import read_log
+from read_work_schedule import check_minima, shortfall_html
+
+
+weekdays = {0: 'lundi 05-07-2027', 1: 'mardi 06-07-2027'}
+shifts = [(480, 60), (540, 60), (600, 60)]
+# Two desks open all day, the second one from 9h on Tuesday
+locations = {0: {'name': 'Accueil', 'times': {0: {'start': 0, 'end': 2}, 1: {'start': 0, 'end': 2}}},
+             1: {'name': 'STM', 'times': {0: {'start': 0, 'end': 2}, 1: {'start': 1, 'end': 2}}}}
+
+
+def test_check_minima(logs):
+    # availability[n, d, s, lo]: one librarian all the time, another one on Monday at 8h only
+    availability = numpy.zeros(shape=(2, 2, 3, 2), dtype=numpy.int8)
+    availability[0] = 1
+    availability[1, 0, 0] = 1
+    msg, shortfall = check_minima(*logs, availability, {0: {}, 1: {}}, locations, {}, {}, {}, weekdays, shifts)
+    # The last shift of the last day is never staffed
+    assert shortfall.tolist() == [[0, 1, 1], [0, 1, 0]]
+    assert msg == ('Warning: not enough staff to fill the lundi 05-07-2027 09h00 (1), 10h00 (1) slot(s)<br/>\n'
+                   'Warning: not enough staff to fill the mardi 06-07-2027 09h00 (1) slot(s)<br/>\n')
+    # A gap in the coverage is a warning of the log, not an error of the run
+    assert '3 day/shift slot(s) cannot be fully staffed, 3 librarian(s) missing' in read_log(logs[0])
+    assert not os.path.exists(logs[1])
+
+
+def test_check_minima_enough_staff(logs):
+    availability = numpy.ones(shape=(2, 2, 3, 2), dtype=numpy.int8)
+    msg, shortfall = check_minima(*logs, availability, {0: {}, 1: {}}, locations, {}, {}, {}, weekdays, shifts)
+    assert msg == '' and not shortfall.any()
+    assert 'cannot be fully staffed' not in read_log(logs[0])
+
+
+def test_shortfall_html():
+    html = shortfall_html(numpy.array([[0, 1, 2], [0, 2, 0]]), weekdays, shifts)
+    assert '<th scope="col">08:00</th><th scope="col">09:00</th><th scope="col">10:00</th>' in html
+    assert html.count('<tr><td>') == 2
+    # Darker for the worst slots
+    assert 'rgba(220, 53, 69, 0.60)">1</td>' in html and html.count('rgba(220, 53, 69, 1.00)">2</td>') == 2
+    assert html.count('<td></td>') == 3
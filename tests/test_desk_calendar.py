@@ -0,0 +1,51 @@
+from datetime import date
+
+import numpy
+import pytest
+
+from desk_calendar import parse_day, build_calendar, calendar_weeks, absence_mask
+
+
+# Monday 5 to Friday 9 July, then Monday 12 and Tuesday 13 July 2027
+weekdays = {0: 'lundi 05-07-2027', 1: 'mardi 06-07-2027', 2: 'mercredi 07-07-2027', 3: 'jeudi 08-07-2027',
+            4: 'vendredi 09-07-2027', 5: 'lundi 12-07-2027', 6: 'mardi 13-07-2027'}
+
+
+def test_parse_day():
+    assert parse_day('lundi 08-07-2024') == date(2024, 7, 8)
+    assert parse_day('2024-07-08') == date(2024, 7, 8)
+    assert parse_day('not a day') is None
+
+
+def test_build_calendar(logs):
+    calendar = build_calendar(weekdays, logs[0])
+    assert [calendar[d]['date'] for d in (0, 4, 5)] == [date(2027, 7, 5), date(2027, 7, 9), date(2027, 7, 12)]
+    assert [calendar[d]['weekday'] for d in weekdays] == [0, 1, 2, 3, 4, 0, 1]
+    assert [calendar[d]['week'] for d in weekdays] == [0, 0, 0, 0, 0, 1, 1]
+
+
+def test_calendar_weeks(logs):
+    assert calendar_weeks(build_calendar(weekdays, logs[0])) == [[0, 1, 2, 3, 4], [5, 6]]
+    assert calendar_weeks({}) == []
+
+
+def test_absence_mask(logs):
+    calendar = build_calendar(weekdays, logs[0])
+    vacation = {'A': [('2027-07-06', '2027-07-06')],
+                # Both days included, over the weekend
+                'B': [('2027-07-09', '2027-07-12'), ('2027-07-13', '2027-07-20')],
+                'Not a librarian': [('2027-07-05', '2027-07-13')],
+                # Ending before it starts: still its first day
+                'C': [('2027-07-07', '2027-07-06')]}
+    absent = absence_mask(vacation, ['A', 'B', 'C', 'D'], calendar)
+    assert absent.shape == (4, 7)
+    assert numpy.array_equal(absent, [[0, 1, 0, 0, 0, 0, 0],
+                                      [0, 0, 0, 0, 1, 1, 1],
+                                      [0, 0, 1, 0, 0, 0, 0],
+                                      [0, 0, 0, 0, 0, 0, 0]])
+
+
+def test_absence_mask_invalid_leave(logs):
+    calendar = build_calendar(weekdays, logs[0])
+    with pytest.raises(ValueError):
+        absence_mask({'A': [('someday', '2027-07-06')]}, ['A'], calendar)
@@ -0,0 +1,142 @@
+import json
+import re
+from collections import Counter
+
+import pytest
+
+from conftest import read_log
+from or_librarydesk_schedule import main
+from rolling_horizon import WeekNotSolved
+from run_metrics import metrics_filename
+from schedule_solution import solution_filename, load_solution
+
+
+first_rules = ['oneLibrarianPerShift', 'oneShiftAtATime', 'maxTwoShiftsPerDay', 'noOutOfTimeShift']
+
+# Few librarians for two desks: the open slots cannot all be covered
+scarce = {'num_librarians': 4, 'density': 0.6, 'rules': ['oneLibrarianPerShift', 'oneShiftAtATime', 'noOutOfTimeShift']}
+
+# Three weeks, with the minimum hours of the period
+minimums = {'num_librarians': 20, 'num_days': 15, 'num_locations': 3, 'density': 0.8,
+            'rules': first_rules + ['ScaleQuotas', 'holidaySpecialQuota', 'minActiveShifts', 'maxActiveShifts']}
+
+
+def assignments(filename):
+    return load_solution(solution_filename(filename))['assignments']
+
+
+def test_schedule(workbook, logs):
+    filename = workbook(rules=first_rules)
+    result = main(filename, *logs)
+    assert result['status'] == 'OPTIMAL'
+    assert result['objective'] == result['max_score']
+    # One librarian per open slot
+    slots = Counter([(a['date'], a['start'], a['location']) for a in assignments(filename)])
+    assert len(slots) == result['max_score'] and max(slots.values()) == 1
+
+
+def test_repair(workbook, logs):
+    filename = workbook(rules=first_rules + ['useAbsences'])
+    main(filename, *logs)
+    previous = assignments(filename)
+    absent = previous[0]['librarian']
+    leave_day = previous[0]['date']
+    with open('vacation.json', 'w') as fp:
+        json.dump({absent: [[leave_day, leave_day]]}, fp)
+    previous_file = filename.replace('.xlsx', '_previous_solution.json')
+    with open(solution_filename(filename)) as fp, open(previous_file, 'w') as out:
+        out.write(fp.read())
+
+    result = main(filename, *logs, repair=previous_file)
+    repaired = assignments(filename)
+    assert result['objective'] == result['max_score']
+    assert not any(a['librarian'] == absent and a['date'] == leave_day for a in repaired)
+    # The other days are kept as they were
+    kept = [(a['librarian'], a['date'], a['start'], a['location']) for a in previous if a['date'] != leave_day]
+    assert kept == [(a['librarian'], a['date'], a['start'], a['location']) for a in repaired if a['date'] != leave_day]
+
+
+def test_absences(workbook, logs):
+    filename = workbook(rules=first_rules + ['useAbsences'])
+    with open('vacation.json', 'w') as fp:
+        # A one-day leave, and a leave over two days
+        json.dump({'Guichetier 001': [['2027-07-06', '2027-07-06']],
+                   'Guichetier 002': [['2027-07-07', '2027-07-08']]}, fp)
+    main(filename, *logs)
+    on_leave = [(a['librarian'], a['date']) for a in assignments(filename)
+                if (a['librarian'], a['date']) in (('Guichetier 001', '2027-07-06'), ('Guichetier 002', '2027-07-07'),
+                                                   ('Guichetier 002', '2027-07-08'))]
+    assert on_leave == []
+    log = read_log(logs[0])
+    assert 'Absences: 3 librarian-day(s) removed from the availability' in log
+    assert re.search(r'Guichetier 001 is working .*\(1 day\(s\) on leave\)', log)
+    assert re.search(r'Guichetier 002 is working .*\(2 day\(s\) on leave\)', log)
+
+
+def test_weekly_same_as_single(workbook, logs):
+    filename = workbook(**minimums)
+    single = main(filename, *logs, solver_options={'maxTime': 30})
+    weekly = main(filename, *logs, solver_options={'maxTime': 30}, weekly=True)
+    assert single['status'] == weekly['status'] == 'OPTIMAL'
+    assert single['objective'] == weekly['objective'] == weekly['max_score']
+    # Same type in both modes, e.g. in the solution files
+    assert type(single['objective']) is type(weekly['objective']) is int
+    assert load_solution(solution_filename(filename))['objective'] == weekly['objective']
+    assert len(weekly['reports']) == 4
+
+
+def test_weekly_infeasible(workbook, logs):
+    filename = workbook(**dict(minimums, rules=minimums['rules'] + ['minReserveShifts']))
+    with pytest.raises(WeekNotSolved):
+        main(filename, *logs, solver_options={'maxTime': 30}, weekly=True)
+    with open(metrics_filename(filename)) as fp:
+        assert json.load(fp)['status'] == 'INFEASIBLE'
+
+
+def test_report_split_by_week(workbook, logs):
+    filename = workbook(rules=first_rules, num_days=10)
+    result = main(filename, *logs)
+    index = filename.replace('.xlsx', '.html')
+    assert result['reports'] == [index, filename.replace('.xlsx', '_week1.html'), filename.replace('.xlsx', '_week2.html')]
+    with open(index) as fp:
+        html = fp.read()
+    assert 'desk_week1.html' in html and 'desk_week2.html' in html
+    with open(result['reports'][2]) as fp:
+        assert 'lundi 12-07-2027' in fp.read()
+
+
+def test_soft_coverage(workbook, logs):
+    with pytest.raises(Exception):
+        main(workbook('hard.xlsx', **scarce), *logs)
+
+    filename = workbook('soft.xlsx', rule_weights={'oneLibrarianPerShift': 2}, **scarce)
+    result = main(filename, *logs, solver_options={'maxTime': 20})
+    assert result['status'] == 'OPTIMAL'
+    # Never two librarians at a desk, one penalty per open slot left empty
+    slots = Counter([(a['date'], a['start'], a['location']) for a in assignments(filename)])
+    assert max(slots.values()) == 1
+    assert len(slots) == result['objective'] < result['max_score']
+    assert read_log(logs[0]).count('oneLibrarianPerShift at ') == result['max_score'] - result['objective']
+
+
+def test_soft_rule_per_day(workbook, logs):
+    filename = workbook(num_librarians=6, density=0.7, rules=first_rules[:2] + ['maxOneShiftPerDay'],
+                        rule_weights={'maxOneShiftPerDay': 1})
+    result = main(filename, *logs, solver_options={'maxTime': 5})
+    assert result['status'] in ('OPTIMAL', 'FEASIBLE')
+    # One penalty per librarian and day with more than one shift
+    days = Counter([(a['librarian'], a['date']) for a in assignments(filename)])
+    assert len(re.findall(r'maxOneShiftPerDay on \w+ [\d-]+ \(penalty 1\)', read_log(logs[0]))) == \
+        len([day for day, count in days.items() if count > 1]) > 0
+
+
+def test_alternatives(workbook, logs):
+    filename = workbook(rules=first_rules)
+    result = main(filename, *logs, alternatives=3, alternatives_time=10)
+    best = {(a['librarian'], a['date'], a['start'], a['location']) for a in assignments(filename)}
+    found = []
+    for k in range(1, 3):
+        alternative = load_solution(filename.replace('.xlsx', f'_alt{k}_solution.json'))
+        assert alternative['objective'] == result['objective']
+        found.append({(a['librarian'], a['date'], a['start'], a['location']) for a in alternative['assignments']})
+    assert best != found[0] and best != found[1] and found[0] != found[1]
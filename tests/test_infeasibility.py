@@ -0,0 +1,46 @@
+import re
+
+import pytest
+from ortools.sat.python import cp_model
+
+from conftest import read_log
+from infeasibility import minimal_core, describe_core
+from or_librarydesk_schedule import main
+
+
+def conflicting_desk():
+    """
+    Three rules about two librarians, the first two of them incompatible
+    """
+    model = cp_model.CpModel()
+    works = model.NewBoolVar('works')
+    rules = {}
+    for rule, n, constraint in (('minActiveShifts', 0, works == 1), ('maxActiveShifts', 1, works == 0),
+                                ('maxDaysAtDesk', 0, works <= 1)):
+        literal = model.NewBoolVar(rule)
+        model.Add(constraint).OnlyEnforceIf(literal)
+        model.AddAssumption(literal)
+        rules[literal.Index()] = (rule, {'librarian': n})
+    return {'model': model, 'assumptions': rules, 'librarians': {0: {'name': 'Ada'}, 1: {'name': 'Bob'}}}
+
+
+def test_minimal_core(logs):
+    desk = conflicting_desk()
+    core, proven = minimal_core(desk, list(desk['assumptions'].keys()), {}, logs[0])
+    assert proven
+    assert sorted([desk['assumptions'][literal][0] for literal in core]) == ['maxActiveShifts', 'minActiveShifts']
+    assert describe_core(desk, {}, core) == ['minActiveShifts for Ada', 'maxActiveShifts for Bob']
+
+
+def test_explain_infeasibility(workbook, logs):
+    # Four librarians, only during their requested hours, cannot staff two desks all day
+    filename = workbook(num_librarians=4, density=0.6, rules=['oneLibrarianPerShift', 'oneShiftAtATime', 'noOutOfTimeShift'])
+    with pytest.raises(Exception):
+        main(filename, *logs)
+    errors = read_log(logs[1])
+    assert 'INFEASIBLE: the selected rules cannot all be satisfied.' in errors
+    # A slot with more desks to staff than librarians available (alone, or with the rules that keep the others away)
+    assert re.search(r'oneLibrarianPerShift on \w+ [\d-]+ at \d+h\d* \(2 location\(s\) to staff, [01] librarian\(s\) available\)'
+                     r'( cannot be satisfied)?\.', errors)
+    assert 'Deselecting one of these rules' in errors
+    assert 'With noOutOfTimeShift, librarians can only be assigned during their requested hours' in errors
@@ -0,0 +1,36 @@
+import numpy
+
+from conftest import read_log, edit_workbook
+from desk_model import rule_names
+from input_cache import read_cached_work_schedules
+from read_work_schedule import read_work_schedules
+
+
+rules = ['oneLibrarianPerShift', 'oneShiftAtATime', 'maxActiveShifts', 'ScaleQuotas']
+
+
+def test_input_cache(workbook, logs):
+    filename = workbook(rules=rules)
+    expected = read_work_schedules(filename, *logs)
+    first = read_cached_work_schedules(filename, *logs)
+    second = read_cached_work_schedules(filename, *logs)
+    assert 'Unchanged workbook' in read_log(logs[0])
+    for result in (first, second):
+        assert numpy.array_equal(result[0], expected[0])
+        assert result[1:] == expected[1:]
+
+    edit_workbook(filename, 'règles', f"B{rule_names.index('maxTwoShiftsPerDay') + 1}", 1)
+    changed = read_cached_work_schedules(filename, *logs)
+    assert 'sheets parsed again: règles' in read_log(logs[0])
+    assert changed[5]['oneShiftAtATime'] == expected[5]['oneShiftAtATime']
+    assert changed[5]['maxTwoShiftsPerDay'] != expected[5]['maxTwoShiftsPerDay']
+    assert numpy.array_equal(changed[0], expected[0])
+
+
+def test_malformed_cells_reported_again(workbook, logs):
+    filename = workbook()
+    edit_workbook(filename, 'guichetiers', 'B1', '9h-midi')
+    read_cached_work_schedules(filename, *logs)
+    read_cached_work_schedules(filename, *logs)
+    assert 'Unchanged workbook' in read_log(logs[0])
+    assert read_log(logs[1]).count("'9h-midi'") == 2
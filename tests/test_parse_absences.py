@@ -0,0 +1,68 @@
+import json
+from datetime import timedelta
+
+from conftest import write_export, read_log, first_day
+from or_librarydesk_schedule import main
+from parse_absences import scan_planning, parse_absences, merge_leaves, absence_files
+
+
+def test_one_export(workdir, logs):
+    export = write_export(workdir / 'july.html', ['Jean Dupont', 'Marie Curie'],
+                          [(0, 2, 2, 'Vacances'), (0, 5, 8, 'Holidays'), (0, 9, 9, 'Télétravail'),
+                           (1, 0, 3, 'Compensation sur heures')])
+    vacation = parse_absences(export, *logs, 'vacation.json', workers=1)
+    # Home office is not a leave, a one-day leave starts and ends on the same day
+    assert vacation == {'Jean Dupont': [('2027-07-07', '2027-07-07'), ('2027-07-10', '2027-07-13')],
+                        'Marie Curie': [('2027-07-05', '2027-07-08')]}
+    with open('vacation.json') as fp:
+        assert json.load(fp) == {name: [list(leave) for leave in leaves] for name, leaves in vacation.items()}
+
+
+def test_names_read_as_utf8_without_charset(workdir, logs):
+    export = write_export(workdir / 'nocharset.html', ['Désirée Noël', 'Jean Dupont'], [], charset=False)
+    assert scan_planning(export)[0] == ['Désirée Noël', 'Jean Dupont']
+
+
+def test_leaves_cut_to_the_displayed_period(workdir, logs):
+    export = write_export(workdir / 'july.html', ['Jean Dupont'], [(0, -3, 1, 'Vacances'), (0, 8, 14, 'Vacances'),
+                                                                 (0, 12, 14, 'Vacances')])
+    vacation = parse_absences(export, *logs, 'vacation.json', workers=1)
+    assert vacation == {'Jean Dupont': [('2027-07-05', '2027-07-06'), ('2027-07-13', '2027-07-14')]}
+
+
+def test_unknown_names_reported(workbook, logs):
+    filename = workbook(rules=['oneLibrarianPerShift', 'oneShiftAtATime', 'maxTwoShiftsPerDay', 'noOutOfTimeShift',
+                               'useAbsences'])
+    with open('vacation.json', 'w') as fp:
+        json.dump({'Personne Inconnue': [['2027-07-06', '2027-07-07']]}, fp)
+    main(filename, *logs)
+    assert f'Personne Inconnue has absences but is not a librarian of {filename}' in read_log(logs[0])
+
+
+def test_exports_merged(workdir, logs):
+    (workdir / 'exports').mkdir()
+    # A leave over the end of the first page, repeated in the second one
+    write_export(workdir / 'exports' / 'a.html', ['Jean Dupont', 'Marie Curie'],
+                 [(0, 8, 9, 'Vacances'), (1, 1, 1, 'Vacances')], num_days=10)
+    write_export(workdir / 'exports' / 'b.html', ['Jean Dupont'],
+                 [(0, 0, 3, 'Vacances')], start=first_day + timedelta(days=10), num_days=10)
+    assert absence_files(str(workdir / 'exports')) == [str(workdir / 'exports' / 'a.html'),
+                                                       str(workdir / 'exports' / 'b.html')]
+    vacation = parse_absences(str(workdir / 'exports'), *logs, 'vacation.json', workers=2)
+    assert vacation == {'Jean Dupont': [('2027-07-13', '2027-07-18')], 'Marie Curie': [('2027-07-06', '2027-07-06')]}
+    assert 'does not list Marie Curie' in read_log(logs[0])
+
+
+def test_gap_between_exports(workdir, logs):
+    write_export(workdir / 'a.html', ['Jean Dupont'], [], num_days=5)
+    write_export(workdir / 'b.html', ['Jean Dupont'], [], start=first_day + timedelta(days=7), num_days=5)
+    parse_absences([str(workdir / 'a.html'), str(workdir / 'b.html')], *logs, 'vacation.json',
+                   workers=1)
+    assert 'No absence export covers 2027-07-10 - 2027-07-11' in read_log(logs[1])
+
+
+def test_merge_leaves():
+    assert merge_leaves([]) == []
+    assert merge_leaves([('2027-07-12', '2027-07-14'), ('2027-07-05', '2027-07-06'), ('2027-07-07', '2027-07-07'),
+                         ('2027-07-13', '2027-07-20'), ('2027-07-05', '2027-07-06')]) == \
+        [('2027-07-05', '2027-07-07'), ('2027-07-12', '2027-07-20')]
@@ -0,0 +1,33 @@
+from conftest import read_log, edit_workbook
+from read_work_schedule import read_work_schedules
+
+
+rules = ['oneLibrarianPerShift', 'oneShiftAtATime', 'maxActiveShifts', 'ScaleQuotas']
+
+
+def test_read_work_schedules(workbook, logs):
+    filename = workbook(rules=rules, rule_weights={'maxActiveShifts': 10, 'ScaleQuotas': 3})
+    availability, librarians, locations, quota, meeting_slots, selected, weekdays, shifts, solver_settings, \
+        rule_weights = read_work_schedules(filename, *logs)
+    # 5 days of 12 one-hour shifts (8h-20h), 2 locations
+    assert availability.shape == (20, 5, 12, 2)
+    assert len(weekdays) == 5 and len(shifts) == 12 and len(locations) == 2
+    assert librarians[0]['name'] == 'Guichetier 001'
+    assert all(selected[name] for name in rules)
+    assert not selected['maxTwoShiftsPerDay']
+    # ScaleQuotas is not a constraint: its weight is reported and ignored
+    assert rule_weights == {'maxActiveShifts': 10}
+    assert 'ScaleQuotas / C' in read_log(logs[1])
+
+
+def test_malformed_cells(workbook, logs):
+    filename = workbook()
+    edit_workbook(filename, 'guichetiers', 'B1', '9h-midi')
+    edit_workbook(filename, 'règles', 'C1', 'heavy')
+    availability, librarians, locations, quota, meeting_slots, selected, weekdays, shifts, solver_settings, \
+        rule_weights = read_work_schedules(filename, *logs)
+    assert availability[0, 0].sum() == 0
+    assert rule_weights == {}
+    errors = read_log(logs[1])
+    assert '2 cells could not be read' in errors
+    assert "'9h-midi'" in errors and "'heavy'" in errors
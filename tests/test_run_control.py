@@ -0,0 +1,118 @@
+import json
+
+import pytest
+from ortools.sat.python import cp_model
+
+from conftest import read_log
+from errors import set_log_level, DEBUG, INFO
+from or_librarydesk_schedule import main
+from run_control import new_run_control, cancel_run, check_cancelled, is_cancelled, RunCancelled
+from run_control import SolutionProgress, objective_gap
+from run_metrics import metrics_filename
+
+
+rules = ['oneLibrarianPerShift', 'oneShiftAtATime', 'maxTwoShiftsPerDay', 'noOutOfTimeShift']
+
+
+def test_cancel_run():
+    run_control = new_run_control()
+    check_cancelled(run_control)
+    check_cancelled(None)
+    assert not is_cancelled(run_control) and not is_cancelled(None)
+    cancel_run(run_control)
+    assert is_cancelled(run_control)
+    with pytest.raises(RunCancelled):
+        check_cancelled(run_control)
+
+
+def cancel_at(stage_name):
+    """
+    A run control that cancels the run when the given stage is reported
+    """
+    stages = []
+
+    def progress(stage, message):
+        stages.append((stage, message))
+        if stage_name in (stage, message):
+            cancel_run(run_control)
+
+    run_control = new_run_control(progress)
+    return run_control, stages
+
+
+def test_weekly_cancelled_before_the_first_week(workbook, logs):
+    filename = workbook(rules=rules, num_days=10)
+    run_control, stages = cancel_at('weekly model build and solve')
+    with pytest.raises(RunCancelled):
+        main(filename, *logs, weekly=True, run_control=run_control)
+    assert ('stage', 'weekly model build and solve') in stages
+    assert not any(stage == 'objective' for stage, message in stages)
+    with open(metrics_filename(filename)) as fp:
+        assert json.load(fp)['status'] == 'CANCELLED'
+
+
+def test_weekly_cancelled_during_a_week(workbook, logs):
+    filename = workbook(rules=rules, num_days=10)
+    run_control, stages = cancel_at('objective')
+    with pytest.raises(RunCancelled):
+        main(filename, *logs, weekly=True, run_control=run_control)
+    # The search of the first week stops at its first schedule, the second week is not solved
+    assert len([stage for stage, message in stages if stage == 'objective']) == 1
+    assert 'Search stopped after 1 schedule(s): cancelled' in read_log(logs[0])
+
+
+def solve_slots(progress, open_slots=7):
+    """
+    Fill at most open_slots of 10 slots; the solver's own bound is 10 until it proves the optimum
+    """
+    model = cp_model.CpModel()
+    slots = [model.NewBoolVar(f'slot {k}') for k in range(10)]
+    model.Add(sum(slots) <= open_slots)
+    model.Maximize(sum(slots))
+    solver = cp_model.CpSolver()
+    solver.parameters.num_workers = 1
+    return solver.Solve(model, progress)
+
+
+def test_objective_gap():
+    assert objective_gap(90, 100) == (10, 10 / 90)
+    assert objective_gap(0, 2) == (2, 2.0)
+
+
+def test_stop_at_target(logs, capsys):
+    progress = SolutionProgress(log_output=logs[0], target=7)
+    solve_slots(progress)
+    assert progress.target_reached
+    assert progress.stop_reason == 'maximum score 7 reached'
+    assert 'Solution 0: objective' in read_log(logs[0])
+    # Logged, not printed
+    assert capsys.readouterr().out == ''
+
+
+def test_stop_at_gap():
+    progress = SolutionProgress(relative_gap=100.0)
+    solve_slots(progress)
+    assert progress.solution_count == 1 and progress.stop_reason.startswith('relative gap')
+    assert not progress.target_reached
+    progress = SolutionProgress(absolute_gap=10)
+    solve_slots(progress)
+    assert progress.solution_count == 1 and progress.stop_reason.startswith('absolute gap')
+    # The target is checked before the gaps
+    progress = SolutionProgress(target=7, relative_gap=0.0)
+    solve_slots(progress)
+    assert progress.target_reached and progress.stop_reason == 'maximum score 7 reached'
+
+
+def test_no_stop():
+    progress = SolutionProgress()
+    assert solve_slots(progress) == cp_model.OPTIMAL
+    assert progress.stop_reason is None
+
+
+def test_solutions_printed_at_debug_level(capsys):
+    set_log_level(DEBUG)
+    try:
+        solve_slots(SolutionProgress(target=7))
+    finally:
+        set_log_level(INFO)
+    assert capsys.readouterr().out.startswith('Solution 0, objective')
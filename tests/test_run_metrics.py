@@ -0,0 +1,45 @@
+import io
+import json
+import tracemalloc
+
+from or_librarydesk_schedule import main
+from report_writer import write_performance
+from run_metrics import new_metrics, start_phase, save_metrics, metrics_filename
+
+
+def test_phases(workdir):
+    metrics = new_metrics('desk.xlsx', trace_memory=True)
+    start_phase(metrics, 'read')
+    data = [0] * 100000
+    start_phase(metrics, 'solve')
+    del data
+    save_metrics('desk_metrics.json', metrics)
+    tracemalloc.stop()
+    with open('desk_metrics.json') as fp:
+        phases = json.load(fp)['phases']
+    assert [p['name'] for p in phases] == ['read', 'solve']
+    assert phases[0]['python_peak_mb'] > 0
+    # Peak of the whole process so far, it never decreases
+    assert phases[1]['process_peak_so_far_mb'] >= phases[0]['process_peak_so_far_mb'] > 0
+
+
+def test_report_leaves_the_phase_open():
+    metrics = new_metrics('desk.xlsx')
+    start_phase(metrics, 'read')
+    start_phase(metrics, 'alternative reports')
+    out = io.StringIO()
+    write_performance(out, {'metrics': metrics})
+    assert metrics['current']['name'] == 'alternative reports'
+    assert [p['name'] for p in metrics['phases']] == ['read']
+    assert '<td>read</td>' in out.getvalue()
+
+
+def test_run_phases(workbook, logs):
+    filename = workbook(rules=['oneLibrarianPerShift', 'oneShiftAtATime', 'maxTwoShiftsPerDay', 'noOutOfTimeShift'])
+    result = main(filename, *logs, alternatives=2, alternatives_time=5)
+    with open(metrics_filename(filename)) as fp:
+        metrics = json.load(fp)
+    names = [p['name'] for p in metrics['phases']]
+    assert names[0] == 'workbook read' and names[-2:] == ['alternatives', 'alternative reports']
+    assert len(names) == len(set(names))
+    assert metrics['objective'] == result['objective']
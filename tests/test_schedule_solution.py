@@ -0,0 +1,76 @@
+from datetime import date
+
+import numpy
+from ortools.sat.python import cp_model
+
+from conftest import read_log
+from desk_model import add_solution_hints
+from or_librarydesk_schedule import main
+from schedule_solution import match_assignments, save_solution, load_solution, solution_filename
+
+
+librarians = {0: {'name': 'Ada'}, 1: {'name': 'Bob'}}
+locations = {0: {'name': 'Accueil'}, 1: {'name': 'STM'}}
+# 8h and 9h, in minutes
+desk_shifts = [(480, 60), (540, 60)]
+# Monday and Tuesday of two weeks
+calendar = {d: {'label': f'day {d}', 'date': day, 'weekday': day.weekday(), 'week': k}
+            for d, (day, k) in enumerate([(date(2027, 7, 5), 0), (date(2027, 7, 6), 0),
+                                          (date(2027, 7, 12), 1), (date(2027, 7, 13), 1)])}
+
+
+def assignment(librarian, day, start, location, week=0):
+    return {'librarian': librarian, 'date': day.isoformat(), 'day': f'{day}', 'weekday': day.weekday(), 'week': week,
+            'start': start, 'length': 60, 'location': location}
+
+
+def test_match_assignments():
+    solution = {'assignments': [assignment('Bob', date(2027, 6, 29), 540, 'STM'),
+                                assignment('Nobody', date(2027, 6, 28), 480, 'STM'),
+                                assignment('Ada', date(2027, 6, 28), 600, 'STM'),
+                                assignment('Ada', date(2027, 6, 28), 480, 'Closed')]}
+    # A one-week schedule repeated every week of the period
+    matched, dropped = match_assignments(solution, librarians, locations, calendar, desk_shifts, by='weekday')
+    assert matched == [(1, 1, 1, 1), (1, 3, 1, 1)]
+    assert [a['librarian'] for a in dropped] == ['Nobody', 'Ada', 'Ada']
+
+    solution = {'assignments': [assignment('Ada', date(2027, 7, 12), 480, 'Accueil', week=1),
+                                assignment('Ada', date(2027, 7, 19), 480, 'Accueil', week=2)]}
+    matched, dropped = match_assignments(solution, librarians, locations, calendar, desk_shifts, by='date')
+    assert matched == [(0, 2, 0, 0)]
+    assert len(dropped) == 1
+
+
+def test_saved_solution_matched_back(workdir):
+    cells = numpy.zeros(shape=(2, 4, 2, 2), dtype=numpy.int8)
+    cells[0, 0, 1, 0] = cells[1, 3, 0, 1] = 1
+    save_solution('desk_solution.json', cells, librarians, locations, calendar, desk_shifts, status='OPTIMAL', objective=2)
+    matched, dropped = match_assignments(load_solution('desk_solution.json'), librarians, locations, calendar,
+                                         desk_shifts, by='date')
+    assert sorted(matched) == [(0, 0, 1, 0), (1, 3, 0, 1)] and dropped == []
+
+
+def test_add_solution_hints():
+    model = cp_model.CpModel()
+    feasible = numpy.ones(shape=(2, 1, 2, 1), dtype=bool)
+    feasible[1, 0, 1, 0] = False
+    shifts = numpy.zeros(shape=feasible.shape, dtype=object)
+    for cell in numpy.argwhere(feasible):
+        shifts[tuple(cell)] = model.NewBoolVar(f'shift_{cell}')
+    desk = {'model': model, 'shifts': shifts, 'feasible': feasible}
+    # The pruned cell cannot be hinted, every other variable is hinted, at 1 or 0
+    assert add_solution_hints(desk, [(0, 0, 1, 0), (1, 0, 1, 0)]) == [(1, 0, 1, 0)]
+    hint = model.Proto().solution_hint
+    assert dict(zip(hint.vars, hint.values)) == {shifts[0, 0, 0, 0].Index(): 0, shifts[0, 0, 1, 0].Index(): 1,
+                                                 shifts[1, 0, 0, 0].Index(): 0}
+
+
+def test_warm_start(workbook, logs):
+    filename = workbook(rules=['oneLibrarianPerShift', 'oneShiftAtATime', 'maxTwoShiftsPerDay', 'noOutOfTimeShift'])
+    first = main(filename, *logs)
+    previous_file = filename.replace('.xlsx', '_previous_solution.json')
+    with open(solution_filename(filename)) as fp, open(previous_file, 'w') as out:
+        out.write(fp.read())
+    result = main(filename, *logs, warm_start=previous_file)
+    assert result['objective'] == first['objective']
+    assert f"{first['max_score']} hints used, 0 previous assignments dropped" in read_log(logs[0])
@@ -0,0 +1,70 @@
+from datetime import time
+
+import pytest
+
+from read_work_schedule import parse_locations
+from time_ranges import parse_time, parse_time_ranges, is_time_cell, available_slots
+
+
+# One-hour shifts from 8h to 20h, in minutes
+shift_starts = list(range(8 * 60, 20 * 60, 60))
+last_end = 20 * 60
+
+
+def test_parse_time():
+    for value in ('8h', '8', '8h00', '8:00', '8.00', ' 8 h ', 8, time(8, 0)):
+        assert parse_time(value) == 480
+    for value in ('8h30', '8:30', '8.30', '8h30h', 8.5, time(8, 30)):
+        assert parse_time(value) == 510
+    assert parse_time('0h') == 0 and parse_time('24h') == 24 * 60
+    for value in ('8h60', 'midi', '', None, '8h-9h'):
+        with pytest.raises(ValueError):
+            parse_time(value)
+
+
+def test_parse_time_ranges():
+    assert parse_time_ranges('8h-12h') == ((480, 720),)
+    assert parse_time_ranges('8h30-12h / 13h15-17h45') == ((510, 720), (795, 1065))
+    assert parse_time_ranges('8h – 12h; 13h — 17h') == ((480, 720), (780, 1020))
+    assert parse_time_ranges('0h-24h') == ((0, 24 * 60),)
+    # Empty interval
+    assert parse_time_ranges('12h-12h') == ((720, 720),)
+    for value in ('8h', '8h-12h / 13h', '12h-8h', '20h-25h', '8h-12h60', 8, None):
+        with pytest.raises(ValueError):
+            parse_time_ranges(value)
+
+
+def test_is_time_cell():
+    assert is_time_cell('8h-12h') and is_time_cell(time(8, 0)) and is_time_cell(8)
+    assert not is_time_cell(None) and not is_time_cell('vacances') and not is_time_cell('  ')
+
+
+def test_available_slots():
+    assert available_slots(shift_starts, last_end, 480, 720) == (0, 3)
+    # Only the shifts fully inside the interval
+    assert available_slots(shift_starts, last_end, 510, 735) == (1, 3)
+    assert available_slots(shift_starts, last_end, 480, 539) is None
+    assert available_slots(shift_starts, last_end, 510, 600) == (1, 1)
+    # Up to the end of the day, and beyond
+    assert available_slots(shift_starts, last_end, 17 * 60, last_end) == (9, 11)
+    assert available_slots(shift_starts, last_end, 17 * 60, 22 * 60) == (9, 11)
+    assert available_slots(shift_starts, last_end, 0, 24 * 60) == (0, 11)
+    # Entirely outside of the shifts
+    assert available_slots(shift_starts, last_end, 0, 480) is None
+    assert available_slots(shift_starts, last_end, 20 * 60, 21 * 60) is None
+    # As in the original parser, an interval starting with the last shift is not counted
+    assert available_slots(shift_starts, last_end, 19 * 60, 21 * 60) is None
+
+
+def test_location_hours_in_whole_hours(logs):
+    parsed = {'jours': {0: 'lundi 05-07-2027', 1: 'mardi 06-07-2027', 2: 'mercredi 07-07-2027'},
+              'shifts': [(start, 60) for start in shift_starts]}
+    malformed = []
+    report = lambda row, column, value, reason: malformed.append((row, column, value))
+    locations = parse_locations([[0, 'Accueil', '8h30-17h30', '8h-17h', 'fermé'],
+                                 [1, 'STM', '7h-22h', '10h45-12h15', None]], parsed, report, logs[0])
+    # Minutes are dropped: 8h30-17h30 is staffed like 8h-17h, from the 8h shift to the 16h one
+    assert locations[0]['times'] == {0: {'start': 0, 'end': 8}, 1: {'start': 0, 'end': 8}, 2: {'start': 0, 'end': 8}}
+    assert locations[1]['times'] == {0: {'start': 0, 'end': 11}, 1: {'start': 2, 'end': 3}, 2: {'start': 2, 'end': 3}}
+    # A day without hours keeps the hours of the previous day
+    assert malformed == [('Accueil', 'mercredi 07-07-2027', 'fermé'), ('STM', 'mercredi 07-07-2027', None)]
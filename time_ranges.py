@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import re
+from bisect import bisect_left, bisect_right
+from datetime import time
+from functools import lru_cache
+
+
+"""
+Times as written in the workbook ("8h", "8h30", "8:30", "8.30", "8") and
+ranges of times ("8h-12h / 13h-17h30"), in minutes since midnight. The same
+cells come back over and over again (and from every sheet), hence the caches.
+Malformed values raise ValueError with the reason.
+"""
+
+time_pattern = re.compile(r'^(\d{1,2})(?:\s*[h:.]\s*(\d{1,2})?)?\s*h?$')
+
+range_separators = re.compile(r'\s*[-–—/;]\s*')
+
+
+@lru_cache(maxsize=None)
+def parse_time(value):
+    """
+    Minutes since midnight (or duration in minutes) of a time cell
+    """
+    if isinstance(value, time):
+        return value.hour * 60 + value.minute
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        # Plain numbers are hours
+        return int(round(value * 60))
+    if not isinstance(value, str):
+        raise ValueError('not a time')
+    match = time_pattern.match(value.strip().lower())
+    if match is None:
+        raise ValueError(f"'{value}' is not a time")
+    minutes = int(match.group(2)) if match.group(2) else 0
+    if minutes >= 60:
+        raise ValueError(f"'{value}': more than 59 minutes")
+    return int(match.group(1)) * 60 + minutes
+
+
+@lru_cache(maxsize=None)
+def parse_time_ranges(value):
+    """
+    Tuple of (start, end) intervals of a cell such as "8h-12h / 13h-17h"
+    """
+    if not isinstance(value, str):
+        raise ValueError('not a time range')
+    parts = [part for part in range_separators.split(value.strip()) if part != '']
+    if len(parts) < 2 or len(parts) % 2 != 0:
+        raise ValueError(f"'{value}': expected start-end pairs")
+    times = [parse_time(part) for part in parts]
+    intervals = tuple((times[k], times[k + 1]) for k in range(0, len(times), 2))
+    for start, end in intervals:
+        if end < start or end > 24 * 60:
+            raise ValueError(f"'{value}': invalid interval {start // 60}h{start % 60:02d}-{end // 60}h{end % 60:02d}")
+    return intervals
+
+
+def is_time_cell(value):
+    """
+    Empty cells and words ("vacances", "absent") just mean "not available"
+    """
+    if value is None:
+        return False
+    if isinstance(value, str):
+        return value.strip()[:1].isdigit()
+    return True
+
+
+def available_slots(starts, last_end, start, end):
+    """
+    First and last shift (indices in the sorted shift starts) fully inside [start, end], or None
+    """
+    if end <= starts[0] or start >= starts[-1]:
+        return None
+    lower_slot = bisect_left(starts, start)
+    # the last 100% possible slot is the one before the last start <= end...
+    upper_slot = bisect_right(starts, end) - 2
+    # ...unless we are beyond the end of the last shift
+    if end >= last_end:
+        upper_slot += 1
+    if upper_slot < lower_slot:
+        return None
+    return lower_slot, upper_slot